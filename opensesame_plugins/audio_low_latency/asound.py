@@ -0,0 +1,141 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import os
+import re
+
+from opensesame_plugins.audio_low_latency.devices import PLAYBACK
+
+ASOUND_FOLDER = '/proc/asound'
+
+INT_PARAMS = ['channels', 'period_size', 'buffer_size', 'avail_min', 'start_threshold', 'stop_threshold']
+
+
+def parse_device_name(device_name):
+    """Returns card, device and subdevice from an ALSA device name such as
+    hw:CARD=PCH,DEV=0 or hw:0,0. Device and subdevice are None when they are
+    not part of the name, card is None when the name has no card."""
+    card = device = subdevice = None
+    match = re.search(r'CARD=([^,]+)', device_name)
+    if match:
+        card = match.group(1)
+        match = re.search(r'(?<!SUB)DEV=(\d+)', device_name)
+        if match:
+            device = int(match.group(1))
+        match = re.search(r'SUBDEV=(\d+)', device_name)
+        if match:
+            subdevice = int(match.group(1))
+        return card, device, subdevice
+
+    match = re.match(r'^[a-z]*hw:(\w+)(?:,(\d+))?(?:,(\d+))?$', device_name)
+    if match:
+        card = match.group(1)
+        if card.isdigit():
+            card = f'card{card}'
+        if match.group(2) is not None:
+            device = int(match.group(2))
+        if match.group(3) is not None:
+            subdevice = int(match.group(3))
+    return card, device, subdevice
+
+
+def read_params(path):
+    """Parses a hw_params or sw_params file into a dict, returns None when the
+    substream is closed or the file can not be read."""
+    try:
+        with open(path, 'r') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+
+    params = {}
+    for line in lines:
+        key, sep, value = line.partition(':')
+        if not sep:
+            continue
+        params[key.strip()] = value.strip()
+    if not params:
+        return None
+    return params
+
+
+def find_substreams(card, direction, device=None, subdevice=None):
+    """Returns the substream folders of card matching the given device and
+    subdevice, every device or subdevice is included when it is None."""
+    stream = 'p' if direction == PLAYBACK else 'c'
+    card_folder = os.path.join(ASOUND_FOLDER, card)
+    try:
+        pcm_names = sorted(os.listdir(card_folder))
+    except OSError:
+        return []
+
+    substreams = []
+    for pcm_name in pcm_names:
+        match = re.match(rf'^pcm(\d+){stream}$', pcm_name)
+        if not match or (device is not None and int(match.group(1)) != device):
+            continue
+        pcm_folder = os.path.join(card_folder, pcm_name)
+        try:
+            sub_names = sorted(os.listdir(pcm_folder))
+        except OSError:
+            continue
+        for sub_name in sub_names:
+            match = re.match(r'^sub(\d+)$', sub_name)
+            if not match or (subdevice is not None and int(match.group(1)) != subdevice):
+                continue
+            substreams.append(os.path.join(pcm_folder, sub_name))
+    return substreams
+
+
+def read_pcm_params(device_name, direction):
+    """Returns a snapshot of the parameters of the open substream that
+    belongs to device_name, or None when it can not be determined.
+
+    The snapshot is a dict with format, rate, channels, period_size,
+    buffer_size, periods, tstamp_mode and the path of the substream.
+    """
+    card, device, subdevice = parse_device_name(device_name)
+    if card is None:
+        return None
+
+    for substream in find_substreams(card, direction, device, subdevice):
+        hw_params = read_params(os.path.join(substream, 'hw_params'))
+        if hw_params is None or 'rate' not in hw_params:
+            continue
+        sw_params = read_params(os.path.join(substream, 'sw_params')) or {}
+
+        snapshot = {'path': substream,
+                    'format': hw_params.get('format'),
+                    'tstamp_mode': sw_params.get('tstamp_mode')}
+        try:
+            # rate is reported as: 44100 (44100/1)
+            snapshot['rate'] = int(hw_params['rate'].split()[0])
+            for key in INT_PARAMS:
+                if key in hw_params:
+                    snapshot[key] = int(hw_params[key])
+                elif key in sw_params:
+                    snapshot[key] = int(sw_params[key])
+        except ValueError:
+            continue
+        if any(key not in snapshot for key in ('channels', 'period_size', 'buffer_size')):
+            continue
+        snapshot['periods'] = int(snapshot['buffer_size'] / snapshot['period_size'])
+        return snapshot
+    return None
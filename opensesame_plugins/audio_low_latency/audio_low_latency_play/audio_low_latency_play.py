@@ -23,11 +23,16 @@ from libopensesame.item import Item
 from libqtopensesame.items.qtautoplugin import QtAutoPlugin
 from libopensesame.exceptions import OSException
 from libopensesame.oslogging import oslogger
+from opensesame_plugins.audio_low_latency.stimuli import close_stimulus, map_stimulus
+from opensesame_plugins.audio_low_latency.timing import alsa_status, portaudio_latency, to_clock
 from openexp.keyboard import Keyboard
+from opensesame_plugins.audio_low_latency.periods import CachedPeriods
+from opensesame_plugins.audio_low_latency.tracing import PeriodTrace, TRACE_FORMATS, TRACE_NO
+import os
 import wave
+import math
 
-POLL_TIME = 1
-TIMESTAMP = 0
+POLL_TIME = 10
 PADDING = True
 
 
@@ -37,15 +42,19 @@ class AudioLowLatencyPlay(Item):
         self.var.filename = ''
         self.var.duration = 'sound'
         self.var.delay = 0
+        self.var.start_at = ''
         self.var.pause_resume = ''
         self.var.stop = ''
         self.var.ram_cache = 'yes'
+        self.var.trace = TRACE_NO
+        self.trace_count = 0
 
     def prepare(self):
         super().prepare()
         self._check_init()
         self._init_var()
-        self.kb = Keyboard(self.experiment, timeout=1)
+        self._set_preload_var()
+        self.kb = Keyboard(self.experiment, timeout=0)
 
         if self.pause_resume != '':
             self._allowed_responses_pause_resume = []
@@ -75,29 +84,48 @@ class AudioLowLatencyPlay(Item):
             raise OSException('Delay should be a integer')
 
         if self.dummy_mode == 'no':
+            self._close_mapped()
             try:
                 self._show_message('\n')
                 self._show_message(f"Loading sound file: {self.filename} ...")
-                self.wav_file = wave.open(self.filename, 'rb')
+                if self.ram_cache == 'yes':
+                    self.wav_file = None
+                    stimulus, cache_hit = self.cache.get(self.filename)
+                    wav_file_sampwidth = stimulus.sampwidth
+                    wav_file_framerate = stimulus.framerate
+                    wav_file_nchannels = stimulus.nchannels
+                    wav_file_nframes = stimulus.nframes
+                elif self.ram_cache == 'mmap':
+                    self.wav_file = None
+                    stimulus = map_stimulus(self.filename)
+                    wav_file_sampwidth = stimulus.sampwidth
+                    wav_file_framerate = stimulus.framerate
+                    wav_file_nchannels = stimulus.nchannels
+                    wav_file_nframes = stimulus.nframes
+                else:
+                    self.wav_file = wave.open(self.filename, 'rb')
+                    wav_file_sampwidth = self.wav_file.getsampwidth()
+                    wav_file_framerate = self.wav_file.getframerate()
+                    wav_file_nchannels = self.wav_file.getnchannels()
+                    wav_file_nframes = self.wav_file.getnframes()
                 self._show_message('Succesfully loaded sound file...')
             except Exception as e:
                 raise OSException(f"Could not load audio file\n\nMessage: {e}")
 
             error_msg_list = []
 
-            if self.wav_file.getsampwidth() * 8 != self.bitdepth:
-                error_msg_list.append(f"- bitdepth incorrect, file is {self.wav_file.getsampwidth()*8}bit but experiment is set to {self.bitdepth}bit\n")
-            if self.wav_file.getframerate() != self.samplerate:
-                error_msg_list.append(f"- samplerate incorrect, file is {self.wav_file.getframerate()}Hz but experiment is set to {self.samplerate}Hz\n")
-            if self.wav_file.getnchannels() != self.channels:
-                error_msg_list.append(f"- number of channels incorrect, file has {self.wav_file.getnchannels()} channel(s) but experiment is set to {self.channels} channel(s)\n")
-            if self.wav_file.getnframes() < self.period_size:
-                error_msg_list.append(f"- Period size is larger than total number of frames in wave file, use a period size smaller than {self.wav_file.getnframes()} frames\n")
+            if wav_file_sampwidth * 8 != self.bitdepth:
+                error_msg_list.append(f"- bitdepth incorrect, file is {wav_file_sampwidth*8}bit but experiment is set to {self.bitdepth}bit\n")
+            if wav_file_framerate != self.samplerate:
+                error_msg_list.append(f"- samplerate incorrect, file is {wav_file_framerate}Hz but experiment is set to {self.samplerate}Hz\n")
+            if wav_file_nchannels != self.channels:
+                error_msg_list.append(f"- number of channels incorrect, file has {wav_file_nchannels} channel(s) but experiment is set to {self.channels} channel(s)\n")
+            if wav_file_nframes < self.period_size:
+                error_msg_list.append(f"- Period size is larger than total number of frames in wave file, use a period size smaller than {wav_file_nframes} frames\n")
             if error_msg_list:
                 raise OSException(f"Error with audio file {self.filename}\n{''.join(error_msg_list)}")
 
-            wav_file_nframes = self.wav_file.getnframes()
-            self.wav_duration = round(float(wav_file_nframes) / float(self.wav_file.getframerate()) * 1000, 1)
+            self.wav_duration = round(float(wav_file_nframes) / float(wav_file_framerate) * 1000, 1)
             n_periods = round(wav_file_nframes / self.period_size, 2)
             self.experiment.var.wav_duration = self.wav_duration
             self._show_message(f"Audio file duration: {self.wav_duration} ms")
@@ -128,14 +156,44 @@ class AudioLowLatencyPlay(Item):
             else:
                 raise OSException(error_msg)
 
+            if self.duration_check:
+                self.duration_frames = int(round(self.duration * self.samplerate / 1000))
+            else:
+                self.duration_frames = wav_file_nframes
+            self.nframes = min(self.duration_frames, wav_file_nframes)
+            # a duration longer than the sound is filled up with silent periods
+            padded_nframes = math.ceil(self.nframes / self.period_size) * self.period_size
+            self.silent_periods = max(0, math.ceil((self.duration_frames - padded_nframes) / self.period_size))
+            self._show_message(f"Number of frames to be played: {self.nframes} frames")
+            if self.silent_periods > 0:
+                self._show_message(f"Number of silent periods after the sound: {self.silent_periods} periods")
+            self._init_trace(math.ceil(self.nframes / self.period_size) + self.silent_periods)
+
             if self.ram_cache == 'yes':
-                self._show_message('Loading wave file into cache...')
-                self.wav_file_data = self.wav_file.readframes(wav_file_nframes)
-                self._show_message('Done! Closing wave file...')
-                self.wav_file.close()
+                self.wav_file_data = stimulus.data
+                if cache_hit:
+                    self._show_message('Using wave file from cache')
+                else:
+                    self._show_message('Loaded wave file into cache')
+                self.experiment.var.audio_low_latency_play_cache_hits = self.cache.hits
+                self.experiment.var.audio_low_latency_play_cache_misses = self.cache.misses
+            elif self.ram_cache == 'mmap':
+                self.wav_file_data = stimulus.data
+                self._show_message('Reading from memory mapped wave file')
             elif self.ram_cache == 'no':
                 self._show_message('Reading directly from wave file, no cache')
 
+            if self.ram_cache in ['yes', 'mmap']:
+                frame_size = self.samplewidth * self.channels
+                self.wav_file_view = memoryview(self.wav_file_data)[:self.nframes * frame_size]
+                self.play_size = (padded_nframes + self.silent_periods * self.period_size) * frame_size
+                # the playback loop only slices views of whole periods, the last
+                # partial period is copied once and padded with silence here
+                self.cached_periods = CachedPeriods(self.wav_file_view, self.data_size, self.silent_periods, PADDING)
+            if self.ram_cache == 'mmap':
+                # closed by a later prepare of this item or by the init item
+                self.experiment.audio_low_latency_play_mapped.append((self.name, stimulus, [self.wav_file_view, self.cached_periods.data]))
+
         elif self.dummy_mode == 'yes':
             self._set_stimulus_onset()
             self._show_message('Dummy mode enabled, prepare phase')
@@ -148,8 +206,13 @@ class AudioLowLatencyPlay(Item):
         _start_time = self.clock.time()
 
         if self.dummy_mode == 'no':
-            while self.experiment.audio_low_latency_play_locked:
-                self.clock.sleep(POLL_TIME)
+            self.controller.wait_finished()
+            # a failed job of a start item is raised by the next item
+            error = self.controller.take_error()
+            if error is not None:
+                raise OSException(f'Audio playback failed\n\nMessage: {error}')
+            self._init_start_at()
+            self.controller.begin()
             if self.delay_check:
                 time_passed = self.clock.time() - _start_time
                 delay = self.delay - time_passed
@@ -163,102 +226,109 @@ class AudioLowLatencyPlay(Item):
                     _keylist.extend(self._allowed_responses_stop)
                 self.kb.keylist = _keylist
                 self.kb.flush()
+            self.poll_keys = self.pause_resume != '' or self.stop != ''
+            self.poll_time = self.clock.time()
             self._show_message('Initializing audio playback')
             if self.ram_cache == 'no':
                 self._play(self.device, self.wav_file, self.period_size, delay)
-            elif self.ram_cache == 'yes':
-                self._play(self.device, self.wav_file, self.data_size, delay, self.wav_file_data)
+            elif self.ram_cache in ['yes', 'mmap']:
+                self._play(self.device, self.wav_file, self.data_size, delay, self.cached_periods)
         elif self.dummy_mode == 'yes':
             self._set_stimulus_onset()
             self._show_message('Dummy mode enabled, NOT playing audio')
         else:
             raise OSException('Error with dummy mode!')
 
-    def _play(self, stream, wav_file, chunk, delay, wav_data=None):
+    def _play(self, stream, wav_file, chunk, delay, cached_periods=None):
+
+        if self.engine is not None:
+            self._play_callback(delay)
+            return
 
         period = 0
         pause_duration = 0
 
-        self.duration_exceeded = False
+        silent_periods = self.silent_periods
 
         if self.ram_cache == 'no':
-            data = wav_file.readframes(chunk)
-        elif self.ram_cache == 'yes':
-            start = 0
-            data = wav_data[start:start+chunk]
-            start += chunk
-        data_length = len(data)
-        self._show_message(f"Chunk size: {data_length} bytes")
+            data = wav_file.readframes(min(chunk, self.nframes))
+            frames_left = self.nframes - chunk
+            data_length = len(data)
+            # a duration shorter than a period, padded like the last period
+            if PADDING and 0 < data_length < self.data_size:
+                self._show_message('Padding last period with silence')
+                data = data + self.silence[data_length:]
+        elif self.ram_cache in ['yes', 'mmap']:
+            # a duration shorter than a period has no whole periods, only the tail
+            periods = iter(cached_periods)
+            data, data_length = next(periods, (b'', 0))
+        self._show_message(f"Chunk size: {len(data)} bytes")
         if self.delay_check:
             if delay >= 1:
                 self._show_message(f"Delaying audio playback for {delay} ms")
                 self.clock.sleep(delay)
                 self._show_message('Delay done')
-        self.start_time = self._set_stimulus_onset()
+        if self.start_at is not None:
+            self.start_time = self._set_stimulus_onset(self._schedule(stream))
+        else:
+            self.start_time = self._set_stimulus_onset()
+        self._set_stimulus_timing('onset_hw', 'NA')
         self._show_message('Starting audio playback')
-
-        if TIMESTAMP == 1:
-            timestamp_list = []
-            timestamp_list.append(str(self.clock.time()))
-        elif TIMESTAMP == 2:
-            self._show_message(self.clock.time())
+        self.xrun_times = []
+        self.write_time = self.clock.time()
 
         while len(data) > 0:
 
-            stream.write(data)
+            self._write(stream, data)
             period += 1
+            if period == 1:
+                self._set_hardware_onset(stream)
 
-            if TIMESTAMP == 1:
-                timestamp_list.append(str(self.clock.time()))
-            elif TIMESTAMP == 2:
-                self._show_message(self.clock.time())
+            if self.period_trace is not None:
+                self.period_trace.add(stream, self.clock.time())
 
             if self.ram_cache == 'no':
-                data = wav_file.readframes(chunk)
-                if len(data) == 0:
+                data = wav_file.readframes(max(0, min(chunk, frames_left)))
+                frames_left -= chunk
+                if len(data) > 0:
+                    data_length = len(data)
+                    if PADDING and data_length < self.data_size:
+                        self._show_message('Padding last period with silence')
+                        data = data + self.silence[data_length:]
+                elif silent_periods > 0:
+                    data = self.silence
+                    data_length = self.data_size
+                    silent_periods -= 1
+                else:
                     self._show_message('Finished processing audio data')
                     break
-                else:
-                    data_length = len(data)
 
-            elif self.ram_cache == 'yes':
-                if start+chunk <= len(wav_data):
-                    data = wav_data[start:start+chunk]
-                    data_length = len(data)
-                elif start+chunk > len(wav_data) and start < len(wav_data):
-                    data = wav_data[start:start+len(wav_data)]
-                    data_length = len(data)
-                elif start+chunk > len(wav_data) and start >= len(wav_data):
+            elif self.ram_cache in ['yes', 'mmap']:
+                data, data_length = next(periods, (b'', 0))
+                if not data:
                     self._show_message('Finished processing audio data')
                     break
-                start += chunk
-
-            if PADDING and data_length < self.data_size:
-                self._show_message('Padding last period with silence')
-                padding = self.data_size - data_length
-                data = data + b'\x00' * padding
 
-            if self.pause_resume != '' or self.stop != '':
+            if self.poll_keys and self.clock.time() >= self.poll_time:
                 self._check_keys()
-            if self.play_execute_pause == 1 and self.play_continue == 1:
+            if self.controller.paused and not self.controller.stopped:
                 self._show_message('Paused audio playback')
                 pause_start_time = self.clock.time()
                 if self.experiment.audio_low_latency_play_module == self.experiment.pyalsaaudio_module_name:
                     stream.pause(True)
-                while self.play_execute_pause == 1 and self.play_continue == 1:
-                    if self.pause_resume != '' or self.stop != '':
+                if self.poll_keys:
+                    # keys are polled at a low rate while paused
+                    while not self.controller.wait_resumed(POLL_TIME / 1000):
                         self._check_keys()
-                    if self.duration_check:
-                        if self._check_duration():
-                            break
+                else:
+                    self.controller.wait_resumed()
                 if self.experiment.audio_low_latency_play_module == self.experiment.pyalsaaudio_module_name:
                     stream.pause(False)
+                self.write_time = self.clock.time()
                 self._show_message('Resumed audio playback')
                 pause_stop_time = self.clock.time()
                 pause_duration += pause_stop_time - pause_start_time
-            if self.duration_check and not self.duration_exceeded:
-                self._check_duration()
-            if self.play_continue == 0 or self.duration_exceeded:
+            if self.controller.stopped:
                 self._show_message('Stopped audio playback')
                 break
 
@@ -267,10 +337,14 @@ class AudioLowLatencyPlay(Item):
         processing_offset_time = self.clock.time()
 
         if self.experiment.audio_low_latency_play_module == self.experiment.pyalsaaudio_module_name:
-            stream.drain()
-            self._show_message('Draining ALSA stream')
+            if self.controller.stopped:
+                stream.drop()
+                self._show_message('Dropping ALSA stream')
+            else:
+                stream.drain()
+                self._show_message('Draining ALSA stream')
 
-        self._set_stimulus_offset()
+        offset_time = self._set_stimulus_offset()
 
         duration_total_exact = self.clock.time() - self.start_time
         duration_playing_audio_exact = duration_total_exact - pause_duration
@@ -278,11 +352,6 @@ class AudioLowLatencyPlay(Item):
         duration_playing_audio = int(round(duration_playing_audio_exact))
         duration_pause = int(round(pause_duration))
 
-        self.experiment.var.wait_to_finish = int(round(self.duration - duration_playing_audio))
-        if self.experiment.var.wait_to_finish > 0:
-            self._show_message(f"Waiting {self.experiment.var.wait_to_finish} ms for audio to finish")
-            self.clock.sleep(self.experiment.var.wait_to_finish)
-
         if self.ram_cache == 'no':
             wav_file.close()
         self._show_message('Finished audio playback')
@@ -302,39 +371,225 @@ class AudioLowLatencyPlay(Item):
             #self._show_message(f"Full period length: {self.data_size} bytes")
             #self._show_message(f"Last period length: {data_length} bytes")
 
-        if TIMESTAMP == 1:
-            self._show_message("\n".join(timestamp_list))
+        if self.period_trace is not None:
+            self._save_trace()
+        self._set_xruns()
+
+        self.controller.finish(offset_time)
+
+    def _play_callback(self, delay):
+        # the PortAudio callback pulls the periods, this thread only waits
+        if self.delay_check:
+            if delay >= 1:
+                self._show_message(f"Delaying audio playback for {delay} ms")
+                self.clock.sleep(delay)
+                self._show_message('Delay done')
+        self.start_time = self.clock.time()
+        self._show_message('Starting audio playback')
+        self.engine.play(self.wav_file_view, self.play_size, self.controller, self.start_at)
+        if self.poll_keys:
+            while not self.engine.wait(POLL_TIME / 1000):
+                self._check_keys()
+        else:
+            self.engine.wait()
+        if self.controller.stopped:
+            self._show_message('Stopped audio playback')
+
+        # offset is the time the last frame reaches the DAC
+        if self.engine.onset_time is not None:
+            self.start_time = self._set_stimulus_onset(self.engine.onset_time)
+            self._set_stimulus_timing('onset_hw', self.engine.onset_hw_time)
+            if self.start_at is not None:
+                self.experiment.var.audio_low_latency_play_schedule_error = round(self.engine.onset_hw_time - self.start_at, 3)
+        else:
+            self._set_stimulus_onset(self.start_time)
+            self._set_stimulus_timing('onset_hw', 'NA')
+        remaining = self.engine.offset_time - self.clock.time()
+        if remaining > 0:
+            self.clock.sleep(remaining)
+        offset_time = self._set_stimulus_offset(self.engine.offset_time)
+
+        pause_duration = self.engine.paused_frames / self.samplerate * 1000
+        duration_total_exact = offset_time - self.start_time
+        duration_total = int(round(duration_total_exact))
+        duration_playing_audio = int(round(duration_total_exact - pause_duration))
+        duration_pause = int(round(pause_duration))
+
+        self._show_message('Finished audio playback')
+        self._show_message(f"Audio file duration: {self.wav_duration} ms")
+        self._show_message(f"Duration total: {duration_total} ms")
+        self._show_message(f"Duration pauses: {duration_pause} ms")
+        self._show_message(f"Duration playing audio: {duration_playing_audio} ms")
+        self._show_message(f"Number of callbacks: {self.engine.callbacks}")
+        self._show_message('')
+        self.xrun_times = self.engine.xrun_times
+        self._set_xruns()
+
+        self.controller.finish(offset_time)
+
+    def _init_trace(self, periods):
+        # the trace array is allocated here, the playback loop only fills in rows
+        self.period_trace = None
+        if self.trace == TRACE_NO:
+            return
+        if self.var.logfile is None:
+            raise OSException("Path to log file not found.")
+        self.trace_count += 1
+        self.trace_path = f"{os.path.splitext(self.var.logfile)[0]}_{self.name}_{self.trace_count}"
+        self.period_trace = PeriodTrace(periods, self.module, True, getattr(self, 'buffer_size', None))
+
+    def _save_trace(self):
+        mean, sd, maximum = self.period_trace.statistics()
+        self.experiment.var.audio_low_latency_play_period_interval = round(mean, 3)
+        self.experiment.var.audio_low_latency_play_jitter_sd = round(sd, 3)
+        self.experiment.var.audio_low_latency_play_jitter_max = round(maximum, 3)
+        filename = self.period_trace.save(self.trace_path, self.trace)
+        self.experiment.var.audio_low_latency_play_trace_file = filename
+        self._show_message(f"Period interval: {round(mean, 3)} ms, jitter SD {round(sd, 3)} ms, max {round(maximum, 3)} ms")
+        self._show_message(f"Saved trace of {self.period_trace.count} periods to {filename}")
+
+    def _write(self, stream, data):
+        # writes a period and logs an underrun when the backend reports one
+        if self.module == self.experiment.pyalsaaudio_module_name:
+            if stream.write(data) < 0:
+                self._log_xrun()
+            # pyalsaaudio recovers from an underrun inside write(), a write
+            # that returns later than a buffer after the previous one means
+            # the buffer ran empty
+            now = self.clock.time()
+            if now - self.write_time > self.buffer_time:
+                self._log_xrun()
+            self.write_time = now
+        elif self.module == self.experiment.sounddevice_module_name:
+            if stream.write(data):
+                self._log_xrun()
+        elif self.module == self.experiment.pyaudio_module_name:
+            try:
+                stream.write(data, exception_on_underflow=True)
+            except IOError:
+                self._log_xrun()
+        else:
+            stream.write(data)
+
+    def _log_xrun(self):
+        self.xrun_times.append(self.clock.time())
+
+    def _close_mapped(self):
+        # closes the memory mapped files of earlier prepares of this item;
+        # while a sound is playing they stay open until a later prepare
+        if self.controller.active:
+            return
+        mapped = self.experiment.audio_low_latency_play_mapped
+        for entry in [entry for entry in mapped if entry[0] == self.name]:
+            name, stimulus, views = entry
+            close_stimulus(stimulus, views)
+            mapped.remove(entry)
+
+    def _set_preload_var(self):
+        # the preload threads only count in the cache, the progress is
+        # copied to the experiment variables here, in the main thread
+        if self.cache.preload_total:
+            self.experiment.var.audio_low_latency_play_preload_progress = int(self.cache.preload_count * 100 / self.cache.preload_total)
+        self.experiment.var.audio_low_latency_play_preload_done = 'yes' if self.cache.wait_preload(0) else 'no'
+
+    def _set_xruns(self):
+        self.experiment.var.audio_low_latency_play_xruns = len(self.xrun_times)
+        self.experiment.var.audio_low_latency_play_xrun_timestamps = ''.join(f"{time};" for time in self.xrun_times)
+        if self.xrun_times:
+            self._show_message(f"Detected {len(self.xrun_times)} underrun(s)")
+
+    def _init_start_at(self):
+        # read at run time, the target is usually computed from a timestamp
+        # of the current trial
+        self.experiment.var.audio_low_latency_play_schedule_error = 'NA'
+        if self.var.start_at == '':
+            self.start_at = None
+        elif isinstance(self.var.start_at, (int, float)):
+            if self.delay_check:
+                raise OSException('Delay and start time can not be combined')
+            self.start_at = float(self.var.start_at)
+            self._show_message(f"Scheduled audio playback at {self.start_at} ms")
+        else:
+            raise OSException(f'Start time should be empty or a clock time in ms, e.g. {{time_sync + 1000}}, not: {self.var.start_at}')
+
+    def _schedule(self, stream):
+        # sleep until the target is two periods away, then write the silence
+        # that lets the first frame reach the DAC at start_at
+        wait = self.start_at - self.clock.time() - self._queued_frames(stream) / self.samplerate * 1000 - 2 * self.period_time_exact
+        if wait > 0:
+            self.controller.wait_stopped(wait / 1000)
+        now = self.clock.time()
+        if self.controller.stopped:
+            return now
+        queued = self._queued_frames(stream)
+        frames = round((self.start_at - now) * self.samplerate / 1000) - queued
+        if frames < 0:
+            self._show_message(f"Scheduled start missed by {round(-frames / self.samplerate * 1000, 3)} ms")
+            frames = 0
+        if frames > 0:
+            stream.write(bytes(frames * self.samplewidth * self.channels))
+        self._show_message(f"Prefixed {frames} frames of silence")
+        return now + frames / self.samplerate * 1000
+
+    def _queued_frames(self, stream):
+        # frames written to the device that have not reached the DAC yet
+        if self.module == self.experiment.pyalsaaudio_module_name:
+            try:
+                return max(0, self.buffer_size - stream.avail())
+            except Exception:
+                # the stream is not running, the next write starts it
+                return 0
+        elif self.module in [self.experiment.pyaudio_module_name, self.experiment.sounddevice_module_name]:
+            return round(portaudio_latency(stream, True) * self.samplerate)
+        return 0
+
+    def _set_hardware_onset(self, stream):
+        # called after writing the first period to a stream that was empty
+        if self.module == self.experiment.pyalsaaudio_module_name:
+            status = None
+            if self.timestamp_clock is not None:
+                status = alsa_status(stream)
+            if status is None:
+                return
+            timestamp, avail = status
+            queued = self.buffer_size - avail
+            onset_hw = to_clock(self.clock.time, self.timestamp_clock, timestamp + (queued - self.period_size) / self.samplerate)
+        elif self.module in [self.experiment.pyaudio_module_name, self.experiment.sounddevice_module_name]:
+            onset_hw = self.start_time + portaudio_latency(stream, True) * 1000
+        else:
+            return
+        self._set_stimulus_timing('onset_hw', onset_hw)
+        self._show_message(f"Hardware onset: {round(onset_hw - self.start_time, 3)} ms after onset")
+        if self.start_at is not None:
+            # measured, not the rounding of the silence prefix
+            self.experiment.var.audio_low_latency_play_schedule_error = round(onset_hw - self.start_at, 3)
 
     def _check_keys(self):
+        # keyboard events are only delivered on the main thread (SDL, pyglet),
+        # the playback loop polls at most once every POLL_TIME ms
+        self.poll_time = self.clock.time() + POLL_TIME
         key1, time1 = self.kb.get_key()
-        self.kb.flush()
+        if key1 is not None:
+            self._handle_key(key1, time1)
+
+    def _handle_key(self, key1, time1):
         if self.stop != '':
             if key1 in self._allowed_responses_stop:
                 self._show_message('Detected key press for stopping audio')
                 self._log_keys(key1, str(time1))
-                self.play_continue = 0
+                self.controller.stop(time1)
         if self.pause_resume != '':
             if key1 in self._allowed_responses_pause_resume:
                 self._log_keys(key1, str(time1))
-                if self.play_execute_pause == 0:
+                if self.controller.toggle_pause():
                     self._show_message('Detected key press for pausing audio playback')
-                    self.play_execute_pause = 1
-                elif self.play_execute_pause == 1:
+                else:
                     self._show_message('Detected key press for resuming audio playback')
-                    self.play_execute_pause = 0
 
     def _log_keys(self, key1, time1):
         self.experiment.var.audio_low_latency_play_key_presses += f"{key1};"
         self.experiment.var.audio_low_latency_play_key_timestamps += f"{time1};"
 
-    def _check_duration(self):
-        if self.clock.time() - self.start_time >= self.duration:
-            self._show_message('Stopping audio playback, duration exceeded')
-            self.duration_exceeded = True
-            return True
-        else:
-            return False
-
     def _init_var(self):
         self.dummy_mode = self.experiment.audio_low_latency_play_dummy_mode
         self.verbose = self.experiment.audio_low_latency_play_verbose
@@ -344,21 +599,39 @@ class AudioLowLatencyPlay(Item):
             if self.experiment.audio_low_latency_play_module == self.experiment.pyalsaaudio_module_name:
                 self.buffer_size = self.experiment.audio_low_latency_play_buffer_size
                 self.periods = self.experiment.audio_low_latency_play_periods
+                self.buffer_time = self.periods * self.experiment.audio_low_latency_play_period_time_exact
+                self.timestamp_clock = self.experiment.audio_low_latency_play_timestamp_clock
         self.period_size = self.experiment.audio_low_latency_play_period_size
         self.period_time_exact = self.experiment.audio_low_latency_play_period_time_exact
         self.period_time = self.experiment.audio_low_latency_play_period_time
         self.data_size = self.experiment.audio_low_latency_play_data_size
+        self.silence = bytes(self.data_size)
         self.bitdepth = self.experiment.audio_low_latency_play_bitdepth
         self.samplewidth = self.experiment.audio_low_latency_play_samplewidth
         self.samplerate = self.experiment.audio_low_latency_play_samplerate
         self.channels = self.experiment.audio_low_latency_play_channels
+        self.controller = self.experiment.audio_low_latency_play_controller
+        self.cache = self.experiment.audio_low_latency_play_cache
+        self.engine = self.experiment.audio_low_latency_play_engine
 
         self.filename = self.experiment.pool[self.var.filename]
         self.pause_resume = self.var.pause_resume
         self.stop = self.var.stop
         self.ram_cache = self.var.ram_cache
-        self.play_continue = 1
-        self.play_execute_pause = 0
+        if self.ram_cache not in ['yes', 'no', 'mmap']:
+            raise OSException('Cache should be yes, no or mmap')
+        if self.engine is not None and self.ram_cache == 'no':
+            raise OSException('The callback engine needs RAM cache yes or mmap')
+        if self.var.trace in TRACE_FORMATS:
+            self.trace = self.var.trace
+        else:
+            raise OSException(f'Trace should be one of: {", ".join(TRACE_FORMATS)}')
+        if self.engine is not None and self.trace != TRACE_NO:
+            raise OSException('Tracing is only supported by the blocking engine')
+        self.period_trace = None
+        self.xrun_times = []
+        self.experiment.var.audio_low_latency_play_xruns = 0
+        self.experiment.var.audio_low_latency_play_xrun_timestamps = ''
 
         self.experiment.var.audio_low_latency_play_key_presses = ''
         self.experiment.var.audio_low_latency_play_key_timestamps = ''
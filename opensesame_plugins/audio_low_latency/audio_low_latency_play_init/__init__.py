@@ -55,13 +55,70 @@ controls = [
         "var": "period_size",
         "label": "Period size (frames)",
         "name": "line_edit_period_size",
-        "tooltip": "Period size, value is number of samples (64 seems to be the bare minimum, 65536 the maximum)"
+        "tooltip": "Period size, value is number of samples (64 seems to be the bare minimum, 65536 the maximum), auto tunes the period size for PyAlsaAudio"
     }, {
         "type": "line_edit",
         "var": "periods",
         "label": "Number of periods per buffer",
         "name": "line_edit_periods",
-        "tooltip": "value is an integer"
+        "tooltip": "value is an integer, auto tunes the number of periods for PyAlsaAudio"
+    }, {
+        "type": "combobox",
+        "var": "engine",
+        "label": "Engine",
+        "options": [
+            "blocking",
+            "callback"
+        ],
+        "name": "combobox_engine",
+        "tooltip": "blocking -> the playback thread writes every period; callback -> PortAudio pulls the periods from the preloaded sound and reports when they reach the DAC (PyAudio and sounddevice only, needs RAM cache yes or mmap in the play items)"
+    }, {
+        "type": "line_edit",
+        "var": "prime",
+        "label": "Priming (ms)",
+        "name": "line_edit_prime",
+        "tooltip": "Silence written to the audio device after opening it, so the first trial does not suffer from cold-start latency (0 disables priming)"
+    }, {
+        "type": "line_edit",
+        "var": "cache_size",
+        "label": "Stimulus cache size (MB)",
+        "name": "line_edit_cache_size",
+        "tooltip": "Memory budget for preloaded sound files shared by all play items, least recently used files are removed first (0 disables the cache)"
+    }, {
+        "type": "line_edit",
+        "var": "preload",
+        "label": "Preload files",
+        "name": "line_edit_preload",
+        "tooltip": "Pattern of file pool names that are read into the cache in the background, e.g. *.wav (empty disables preloading). audio_low_latency_play_preload_done is yes when all files were loaded at the prepare phase of a play item"
+    }, {
+        "type": "combobox",
+        "var": "rt_policy",
+        "label": "Scheduling policy",
+        "options": [
+            "SCHED_OTHER",
+            "SCHED_FIFO",
+            "SCHED_RR"
+        ],
+        "name": "combobox_rt_policy",
+        "tooltip": "Scheduling policy of the playback thread of the start item, SCHED_FIFO and SCHED_RR are real-time policies that need privileges (e.g. rtprio in /etc/security/limits.conf)"
+    }, {
+        "type": "line_edit",
+        "var": "rt_priority",
+        "label": "Real-time priority",
+        "name": "line_edit_rt_priority",
+        "tooltip": "Priority for SCHED_FIFO and SCHED_RR, value from 1 to 99"
+    }, {
+        "type": "line_edit",
+        "var": "cpu_affinity",
+        "label": "CPU cores",
+        "name": "line_edit_cpu_affinity",
+        "tooltip": "Expecting a semicolon-separated list of cores the playback thread may run on, e.g. 2;3 (empty for all cores)"
+    }, {
+        "type": "checkbox",
+        "var": "lock_memory",
+        "label": "Lock memory",
+        "name": "checkbox_lock_memory",
+        "tooltip": "Lock the memory of OpenSesame in RAM (mlockall) so audio data can not be swapped out"
     }, {
         "type": "text",
         "label": "<small><b>Note:</b> Audio Low Latency Play Init item at the begin of the experiment is needed for initialization of the audio device</small>"
@@ -24,8 +24,6 @@ from libqtopensesame.items.qtautoplugin import QtAutoPlugin
 from libopensesame.exceptions import OSException
 from libopensesame.oslogging import oslogger
 
-POLL_TIME = 100
-
 
 class AudioLowLatencyPlayPause(Item):
 
@@ -40,10 +38,8 @@ class AudioLowLatencyPlayPause(Item):
         self.set_item_onset()
 
         if self.dummy_mode == 'no':
-            while not self.experiment.audio_low_latency_play_thread_running:
-                self.clock.sleep(POLL_TIME)
             self._show_message('Sending pause signal')
-            self.experiment.audio_low_latency_play_execute_pause = 1
+            self.experiment.audio_low_latency_play_controller.pause()
         elif self.dummy_mode == 'yes':
             self._show_message('Dummy mode enabled, NOT playing audio')
         else:
@@ -22,6 +22,12 @@ controls = [
         "label": "Delay (ms)",
         "name": "line_edit_delay",
         "tooltip": "Value in ms"
+    }, {
+        "type": "line_edit",
+        "var": "start_at",
+        "label": "Start at (ms)",
+        "name": "line_edit_start_at",
+        "tooltip": "Clock time in ms at which the playback starts, e.g. {time_sync + 1000} (the expression is evaluated by OpenSesame); silence is written before the sound so the first frame reaches the DAC at that time (empty disables, can not be combined with a delay)"
     }, {
         "type": "line_edit",
         "var": "pause_resume",
@@ -35,11 +41,27 @@ controls = [
         "name": "line_edit_stop",
         "tooltip": "Expecting a semicolon-separated list of button characters, e.g., a;b;c"
     }, {
-        "type": "checkbox",
+        "type": "combobox",
         "var": "ram_cache",
         "label": "Preload",
-        "name": "checkbox_ram_cache",
-        "tooltip": "Preload file to RAM?"
+        "options": [
+            "yes",
+            "no",
+            "mmap"
+        ],
+        "name": "combobox_ram_cache",
+        "tooltip": "yes -> read the file into the stimulus cache; no -> read from disk during playback; mmap -> map the file into memory, for long files"
+    }, {
+        "type": "combobox",
+        "var": "trace",
+        "label": "Trace",
+        "options": [
+            "no",
+            "npy",
+            "csv"
+        ],
+        "name": "combobox_trace",
+        "tooltip": "Save the time, available frames and device delay of every period next to the logfile as a NumPy (.npy) or CSV file; jitter statistics are stored in the audio_low_latency_*_jitter variables"
     }, {
         "type": "text",
         "label": "<b>IMPORTANT:</b> this is a multi-threaded background item, it will immediately advance to the next item, it will NOT wait for the playback to finish."
@@ -24,8 +24,6 @@ from libqtopensesame.items.qtautoplugin import QtAutoPlugin
 from libopensesame.exceptions import OSException
 from libopensesame.oslogging import oslogger
 
-POLL_TIME = 100
-
 
 class AudioLowLatencyPlayStop(Item):
 
@@ -39,13 +37,18 @@ class AudioLowLatencyPlayStop(Item):
         self.set_item_onset()
 
         if self.dummy_mode == 'no':
-            while not self.experiment.audio_low_latency_play_thread_running:
-                self.clock.sleep(POLL_TIME)
+            controller = self.experiment.audio_low_latency_play_controller
+            active = controller.active
+            stop_time = self.clock.time()
             self._show_message('Sending stop signal')
-            self.experiment.audio_low_latency_play_continue = 0
-            if self.experiment.audio_low_latency_play_locked:
-                self.experiment.audio_low_latency_play_thread.join()
-            self.experiment.audio_low_latency_play_thread_running = 0
+            controller.stop(stop_time)
+            controller.wait_finished()
+            self._check_error(controller)
+            # the offset is earlier than the stop signal when the sound had already ended
+            if active and controller.offset_time is not None and controller.offset_time >= stop_time:
+                stop_latency = round(controller.offset_time - stop_time, 1)
+                self.experiment.var.audio_low_latency_play_stop_latency = stop_latency
+                self._show_message(f'Stop latency: {stop_latency} ms')
         elif self.dummy_mode == 'yes':
             self._show_message('Dummy mode enabled, NOT playing audio')
         else:
@@ -61,6 +64,11 @@ class AudioLowLatencyPlayStop(Item):
             raise OSException(
                     '`Audio Low Latency Play Start` item is missing')
 
+    def _check_error(self, controller):
+        error = controller.take_error()
+        if error is not None:
+            raise OSException(f'Audio playback failed\n\nMessage: {error}')
+
     def _check_init(self):
         if not hasattr(self.experiment, 'audio_low_latency_play_device'):
             raise OSException(
@@ -28,6 +28,18 @@ controls = [
         "label": "Start delay (ms)",
         "name": "line_edit_delay_start",
         "tooltip": "Value in ms"
+    }, {
+        "type": "line_edit",
+        "var": "start_at",
+        "label": "Start at (ms)",
+        "name": "line_edit_start_at",
+        "tooltip": "Clock time in ms at which the recording starts, e.g. {time_sync + 1000} (the expression is evaluated by OpenSesame); frames captured before that time are dropped so the first frame was captured at that time (empty disables, can not be combined with a start delay)"
+    }, {
+        "type": "line_edit",
+        "var": "pretrigger",
+        "label": "Pre-trigger (ms)",
+        "name": "line_edit_pretrigger",
+        "tooltip": "Audio from before the start of the recording that is included, taken from the pre-trigger buffer of the init item; audio_low_latency_record_trigger_sample holds the sample index of the start in the file"
     }, {
         "type": "line_edit",
         "var": "delay_stop",
@@ -52,6 +64,17 @@ controls = [
         "label": "Cache to RAM",
         "name": "checkbox_ram_cache",
         "tooltip": "Cache to RAM before saving?"
+    }, {
+        "type": "combobox",
+        "var": "trace",
+        "label": "Trace",
+        "options": [
+            "no",
+            "npy",
+            "csv"
+        ],
+        "name": "combobox_trace",
+        "tooltip": "Save the time, available frames and device delay of every period next to the logfile as a NumPy (.npy) or CSV file; jitter statistics are stored in the audio_low_latency_*_jitter variables"
     }, {
         "type": "text",
         "label": "<b>IMPORTANT:</b> this is a foreground item, it will wait for the recording to finish before advancing to the next item."
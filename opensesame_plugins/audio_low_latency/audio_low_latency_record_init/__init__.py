@@ -55,13 +55,66 @@ controls = [
         "var": "period_size",
         "label": "Period size (frames)",
         "name": "line_edit_period_size",
-        "tooltip": "Period size, value is number of samples (64 seems to be the bare minimum, 65536 the maximum)"
+        "tooltip": "Period size, value is number of samples (64 seems to be the bare minimum, 65536 the maximum), auto tunes the period size for PyAlsaAudio"
     }, {
         "type": "line_edit",
         "var": "periods",
         "label": "Number of periods per buffer",
         "name": "line_edit_periods",
-        "tooltip": "value is an integer"
+        "tooltip": "value is an integer, auto tunes the number of periods for PyAlsaAudio"
+    }, {
+        "type": "combobox",
+        "var": "rt_policy",
+        "label": "Scheduling policy",
+        "options": [
+            "SCHED_OTHER",
+            "SCHED_FIFO",
+            "SCHED_RR"
+        ],
+        "name": "combobox_rt_policy",
+        "tooltip": "Scheduling policy of the recording thread of the start item, SCHED_FIFO and SCHED_RR are real-time policies that need privileges (e.g. rtprio in /etc/security/limits.conf)"
+    }, {
+        "type": "line_edit",
+        "var": "rt_priority",
+        "label": "Real-time priority",
+        "name": "line_edit_rt_priority",
+        "tooltip": "Priority for SCHED_FIFO and SCHED_RR, value from 1 to 99"
+    }, {
+        "type": "line_edit",
+        "var": "cpu_affinity",
+        "label": "CPU cores",
+        "name": "line_edit_cpu_affinity",
+        "tooltip": "Expecting a semicolon-separated list of cores the recording thread may run on, e.g. 2;3 (empty for all cores)"
+    }, {
+        "type": "checkbox",
+        "var": "lock_memory",
+        "label": "Lock memory",
+        "name": "checkbox_lock_memory",
+        "tooltip": "Lock the memory of OpenSesame in RAM (mlockall) so audio data can not be swapped out"
+    }, {
+        "type": "checkbox",
+        "var": "background_finalize",
+        "label": "Finalise files in background",
+        "name": "checkbox_background_finalize",
+        "tooltip": "Write, flush and close wave files in a background thread so Record Stop and Record Wait return as soon as the capture has stopped; all files are complete at the end of the experiment"
+    }, {
+        "type": "line_edit",
+        "var": "pretrigger_buffer",
+        "label": "Pre-trigger buffer (ms)",
+        "name": "line_edit_pretrigger_buffer",
+        "tooltip": "Keep the capture stream running for the whole experiment into a ring buffer of this length, so the record items can include audio from before they were started (0 disables continuous capture)"
+    }, {
+        "type": "line_edit",
+        "var": "session_file",
+        "label": "Session file",
+        "name": "line_edit_session_file",
+        "tooltip": "Record the whole experiment to this file (without extension, relative to the logfile) with an index of the recordings in <session file>_index.csv; the record items then only add their start and stop to the index (empty disables)"
+    }, {
+        "type": "line_edit",
+        "var": "session_segment",
+        "label": "Session segment length (s)",
+        "name": "line_edit_session_segment",
+        "tooltip": "Split the session recording into files of this length, numbered _001, _002, ... (0 records one file)"
     }, {
         "type": "text",
         "label": " <small><b>Note:</b> Audio Low Latency Record Init item at the begin of the experiment is needed for initialization of the audio device</small>"
@@ -19,8 +19,7 @@ __author__ = "Bob Rosbag"
 __license__ = "GPLv3"
 
 import os
-import re
-import subprocess
+import math
 import pygame
 
 from libopensesame.py3compat import *
@@ -28,8 +27,21 @@ from libopensesame.item import Item
 from libqtopensesame.items.qtautoplugin import QtAutoPlugin
 from libopensesame.exceptions import OSException
 from libopensesame.oslogging import oslogger
-
-MODULES_ENABLED = ['alsaaudio', 'sounddevice', 'pyaudio']
+from opensesame_plugins.audio_low_latency.controller import AudioController
+from opensesame_plugins.audio_low_latency.worker import AudioWorker
+from opensesame_plugins.audio_low_latency.writer import DiskWriter
+from opensesame_plugins.audio_low_latency.finalizer import Finalizer
+from opensesame_plugins.audio_low_latency.capture import CaptureRing
+from opensesame_plugins.audio_low_latency.continuous import ContinuousCapture
+from opensesame_plugins.audio_low_latency.session import SessionRecorder, SESSION_BUFFER
+from opensesame_plugins.audio_low_latency.realtime import lock_memory, parse_cpus, set_affinity, set_scheduler, \
+    POLICIES, SCHED_OTHER
+from opensesame_plugins.audio_low_latency.asound import read_pcm_params
+from opensesame_plugins.audio_low_latency.timing import enable_timestamps
+from opensesame_plugins.audio_low_latency.autotune import candidates, load_tuning, measure, save_tuning, tuning_key, \
+    AUTO, FALLBACK_PERIOD_SIZE, FALLBACK_PERIODS
+from opensesame_plugins.audio_low_latency.devices import available_modules, default_module, cached_query_devices, \
+    CAPTURE, PYALSAAUDIO_MODULE_NAME, OSS4_MODULE_NAME, PYAUDIO_MODULE_NAME, SOUNDDEVICE_MODULE_NAME
 
 
 class AudioLowLatencyRecordInit(Item):
@@ -43,97 +55,45 @@ class AudioLowLatencyRecordInit(Item):
         self.var.channels = 2
         self.var.period_size = 1024
         self.var.periods = 4
+        self.var.rt_policy = SCHED_OTHER
+        self.var.rt_priority = 50
+        self.var.cpu_affinity = ''
+        self.var.lock_memory = 'no'
+        self.var.background_finalize = 'no'
+        self.var.pretrigger_buffer = 0
+        self.var.session_file = ''
+        self.var.session_segment = 0
 
         self.experiment.audio_low_latency_record_module_list = []
         self.experiment.audio_low_latency_record_device_dict = {}
         self.experiment.audio_low_latency_record_device_selected_dict = {}
 
-        self.pyalsaaudio_module_name = 'PyAlsaAudio (Linux only)'
-        self.oss4_module_name = 'ossaudiodev (Linux only)'
-        self.pyaudio_module_name = 'PyAudio (PortAudio)'
-        self.sounddevice_module_name = 'SoundDevice (PortAudio)'
+        self.pyalsaaudio_module_name = PYALSAAUDIO_MODULE_NAME
+        self.oss4_module_name = OSS4_MODULE_NAME
+        self.pyaudio_module_name = PYAUDIO_MODULE_NAME
+        self.sounddevice_module_name = SOUNDDEVICE_MODULE_NAME
 
         self.experiment.pyalsaaudio_module_name = self.pyalsaaudio_module_name
         self.experiment.sounddevice_module_name = self.sounddevice_module_name
         self.experiment.pyaudio_module_name = self.pyaudio_module_name
         self.experiment.oss4_module_name = self.oss4_module_name
 
-        if os.name == 'posix':
-            if 'alsaaudio' in MODULES_ENABLED:
-                try:
-                    import alsaaudio
-                    alsa_cards = alsaaudio.pcms(alsaaudio.PCM_CAPTURE)
-                    if alsa_cards:
-                        self.experiment.audio_low_latency_record_module_list.append(self.pyalsaaudio_module_name)
-                        self.experiment.audio_low_latency_record_device_dict[self.pyalsaaudio_module_name] = alsa_cards
-                        self.experiment.audio_low_latency_record_device_selected_dict[self.pyalsaaudio_module_name] = alsa_cards[0]
-                except ImportError:
-                    self._show_message('Could not import alsaaudio')
-
-            if 'ossaudiodev' in MODULES_ENABLED:
-                try:
-                    import ossaudiodev
-                    self.experiment.audio_low_latency_record_module_list.append(self.oss4_module_name)
-                    self.experiment.audio_low_latency_record_device_dict[self.oss4_module_name] = ['Exclusive Mode', 'Shared Mode']
-                    self.experiment.audio_low_latency_record_device_selected_dict[self.oss4_module_name] = 'Exclusive Mode'
-                except ImportError:
-                    self._show_message('Could not import ossaudiodev')
-
-        if 'sounddevice' in MODULES_ENABLED:
-            try:
-                import sounddevice
-                sounddevice_cards = []
-                cards = sounddevice.query_devices()
-                self.experiment.audio_low_latency_record_module_list.append(self.sounddevice_module_name)
-
-                for di in range(0, len(cards)):
-                    sounddevice_cards_dict = cards[di]
-                    sounddevice_cards.append(sounddevice_cards_dict['name'])
-
-                self.experiment.audio_low_latency_record_device_dict[self.sounddevice_module_name] = sounddevice_cards
-                self.experiment.audio_low_latency_record_device_selected_dict[self.sounddevice_module_name] = sounddevice_cards[0]
-
-            except ImportError:
-                self._show_message('Could not import sounddevice')
-
-        if 'pyaudio' in MODULES_ENABLED:
-            try:
-                import pyaudio
-                pyaudio_cards = []
-                pyaudio_device = pyaudio.PyAudio()
-
-                self.experiment.audio_low_latency_record_module_list.append(self.pyaudio_module_name)
-
-                for di in range(0, pyaudio_device.get_device_count()):
-                    pyaudio_cards_dict = pyaudio_device.get_device_info_by_index(di)
-                    pyaudio_cards.append(pyaudio_cards_dict['name'])
-
-                self.experiment.audio_low_latency_record_device_dict[self.pyaudio_module_name] = pyaudio_cards
-                self.experiment.audio_low_latency_record_device_selected_dict[self.pyaudio_module_name] = pyaudio_cards[0]
-
-            except ImportError:
-                self._show_message('Could not import pyaudio')
+        # devices are only enumerated when needed, see _discover_devices and _probe_device
+        self.var.module = default_module(available_modules())
+        self.var.device_name = ''
 
         self._show_message('Audio Low Latency Record plug-in has been initialized!')
 
-        if self.pyalsaaudio_module_name in self.experiment.audio_low_latency_record_module_list:
-            self.var.module = self.pyalsaaudio_module_name
-        elif self.sounddevice_module_name in self.experiment.audio_low_latency_record_module_list:
-            self.var.module = self.sounddevice_module_name
-        elif self.pyaudio_module_name in self.experiment.audio_low_latency_record_module_list:
-            self.var.module = self.pyaudio_module_name
-        elif self.oss4_module_name in self.experiment.audio_low_latency_record_module_list:
-            self.var.module = self.oss4_module_name
-
-        device_list = self.experiment.audio_low_latency_record_device_dict[self.var.module]
-        self.var.device_name = device_list[0]
-
     def prepare(self):
         super().prepare()
         self._reset_device()
         self._init_var()
 
         if self.dummy_mode == 'no':
+            self._probe_device()
+            if self.auto_tune:
+                self._auto_tune()
+
             self._show_message('\nChoosen recording parameters:\n')
             self._show_message(f'Module: {self.module}')
             self._show_message(f'Device: {self.device_name}')
@@ -154,22 +114,12 @@ class AudioLowLatencyRecordInit(Item):
             except:
                 self._show_message('pygame mixer not active')
 
-            if self.module == self.pyalsaaudio_module_name and self.pyalsaaudio_module_name in self.experiment.audio_low_latency_record_module_list:
+            if self.module == self.pyalsaaudio_module_name:
                 import alsaaudio
-                self.device_index = self.experiment.audio_low_latency_record_device_dict[self.pyalsaaudio_module_name].index(self.device_name)
 
                 error_msg_list = []
 
-                if self.bitdepth == 8:
-                    format_audio = alsaaudio.PCM_FORMAT_U8
-                elif self.bitdepth == 16:
-                    format_audio = alsaaudio.PCM_FORMAT_S16_LE
-                elif self.bitdepth == 24:
-                    format_audio = alsaaudio.PCM_FORMAT_S24_LE
-                elif self.bitdepth == 32:
-                    format_audio = alsaaudio.PCM_FORMAT_S32_LE
-                else:
-                    raise ValueError('Unsupported format')
+                format_audio = self._alsa_format(alsaaudio)
 
                 self.device = alsaaudio.PCM(type=alsaaudio.PCM_CAPTURE,
                                             format=format_audio,
@@ -181,6 +131,10 @@ class AudioLowLatencyRecordInit(Item):
 
                 self._show_message('Audio device opened')
 
+                self.experiment.audio_low_latency_record_timestamp_clock = enable_timestamps(self.device)
+                if self.experiment.audio_low_latency_record_timestamp_clock is None:
+                    self._show_message('Hardware timestamps not supported by pyalsaaudio')
+
                 device_info = self.device.info()
 
                 reported_channels = device_info['channels']
@@ -214,68 +168,33 @@ class AudioLowLatencyRecordInit(Item):
 
                 error_msg_list = []
 
-                pattern = "CARD=(.*?),"
-                device_string = re.search(pattern, self.device_name)
-
-                if device_string:
-                    filename_alsa = f'/proc/asound/{device_string.group(1)}/pcm0c/sub0/hw_params'
-                    try:
-                        real_buffer_size_string = subprocess.check_output(['grep', '-w', 'buffer_size', filename_alsa], text=True)
-                        real_period_size_string = subprocess.check_output(['grep', '-w', 'period_size', filename_alsa], text=True)
-                        real_channel_size_string = subprocess.check_output(['grep', '-w', 'channels', filename_alsa], text=True)
-                        real_format_size_string = subprocess.check_output(['grep', '-w', 'format', filename_alsa], text=True)
-                        real_samplerate_string = subprocess.check_output(['grep', '-w', 'rate', filename_alsa], text=True)
-
-                        real_buffer_size_string = real_buffer_size_string.replace('\n','')
-                        real_period_size_string = real_period_size_string.replace('\n','')
-                        real_channel_size_string = real_channel_size_string.replace('\n','')
-                        real_format_size_string = real_format_size_string.replace('\n','')
-                        real_samplerate_string = real_samplerate_string.replace('\n','')
-
-                        real_buffer_size = int(real_buffer_size_string.replace('buffer_size: ',''))
-                        real_period_size = int(real_period_size_string.replace('period_size: ',''))
-                        real_channel_size = int(real_channel_size_string.replace('channels: ',''))
-                        real_format = real_format_size_string.replace('format: ','')
-
-                        pattern_samplerate = "rate: (.*?) "
-                        real_samplerate_string = re.search(pattern_samplerate, real_samplerate_string)
-                        real_samplerate = int(real_samplerate_string.group(1))
-
-                        real_periods = int(real_buffer_size / real_period_size)
-                        real_period_time = round(float(real_period_size) / float(real_samplerate) * 1000, 1)
-
-                        # self._show_message('\nHardware using parameters:\n')
-                        # #self._show_message(f'Bitdepth: {self.bitdepth}bit')
-                        # self._show_message(f'Samplerate: {real_samplerate}Hz')
-                        # self._show_message(f'Channels: {real_channel_size}')
-                        # self._show_message(f'Period size: {real_period_size} frames')
-                        # self._show_message(f'Period size time: {real_period_time}ms\n')
-
-                        if real_period_size != self.period_size:
-                            error_msg_list.append(f'Period size of {self.period_size} frames not supported. {real_period_size} frames is recommended.\n')
-                        else:
-                            self._show_message('Chosen period size is supported and use is verified')
-                        if real_periods != self.periods:
-                            error_msg_list.append(f'{self.periods} periods per buffer not supported\n')
-                        if real_channel_size != self.channels:
-                            error_msg_list.append(f'{self.channels} channel(s) not supported\n')
-                        if real_samplerate != self.samplerate:
-                            error_msg_list.append(f'Samplerate of {self.samplerate} Hz not supported\n')
-
-                    except:
-                        self._show_message('Could not verify parameters within Linux')
-                        real_period_size = None
+                hw_params = read_pcm_params(self.device_name, CAPTURE)
+
+                if hw_params is not None:
+                    self._show_message(f"Verifying parameters with {hw_params['path']}")
+                    self._show_message(f"Hardware format: {hw_params['format']}")
+                    self._show_message(f"Timestamp mode: {hw_params['tstamp_mode']}")
+
+                    if hw_params['period_size'] != self.period_size:
+                        error_msg_list.append(f"Period size of {self.period_size} frames not supported. {hw_params['period_size']} frames is recommended.\n")
+                    else:
+                        self._show_message('Chosen period size is supported and use is verified')
+                    if hw_params['periods'] != self.periods:
+                        error_msg_list.append(f'{self.periods} periods per buffer not supported\n')
+                    if hw_params['channels'] != self.channels:
+                        error_msg_list.append(f'{self.channels} channel(s) not supported\n')
+                    if hw_params['rate'] != self.samplerate:
+                        error_msg_list.append(f'Samplerate of {self.samplerate} Hz not supported\n')
                 else:
                     self._show_message('Could not verify parameters within Linux')
-                    real_period_size = None
 
                 if error_msg_list:
                     raise OSException(f'Error with device: {self.device_name}\n{"".join(error_msg_list)}')
 
-            elif self.module == self.pyaudio_module_name and self.pyaudio_module_name in self.experiment.audio_low_latency_record_module_list:
+            elif self.module == self.pyaudio_module_name:
                 import pyaudio
-                self.device_index = self.experiment.audio_low_latency_record_device_dict[self.pyaudio_module_name].index(self.device_name)
                 self.device_init = pyaudio.PyAudio()
+                self._verify_device_index(lambda index: self.device_init.get_device_info_by_index(index)['name'])
 
                 if self.bitdepth == 32:
                     raise OSException(f'{self.bitdepth}bit audio not supported\n')
@@ -296,10 +215,9 @@ class AudioLowLatencyRecordInit(Item):
                 self._show_message(f'Estimated input latency: {self.device.get_input_latency()}ms ')
                 self._show_message(f'Buffer size: {self.device.get_read_available()} frames ')
 
-            elif self.module == self.sounddevice_module_name and self.sounddevice_module_name in self.experiment.audio_low_latency_record_module_list:
+            elif self.module == self.sounddevice_module_name:
                 import sounddevice
-
-                self.device_index = self.experiment.audio_low_latency_record_device_dict[self.sounddevice_module_name].index(self.device_name)
+                self._verify_device_index(lambda index: sounddevice.query_devices(index)['name'])
 
                 if self.bitdepth == 8:
                     format_audio = 'uint8'
@@ -358,6 +276,26 @@ class AudioLowLatencyRecordInit(Item):
                 self._show_message(f'Overruling period size with hardware buffer for OSS4, using: {self.period_size} frames or {self.period_time}ms')
 
             self.experiment.audio_low_latency_record_device = self.device
+            if self.lock_memory == 'yes':
+                error = lock_memory()
+                if error is not None:
+                    self._show_message(error)
+                else:
+                    self._show_message('Locked memory')
+                    self.experiment.var.audio_low_latency_record_memory_locked = 'yes'
+
+            self.experiment.audio_low_latency_record_worker = AudioWorker(self.experiment.audio_low_latency_record_controller, self._setup_worker)
+            self.experiment.audio_low_latency_record_worker.start()
+            self.experiment.audio_low_latency_record_worker.ready.wait()
+            self.experiment.audio_low_latency_record_writer = DiskWriter()
+            self.experiment.audio_low_latency_record_writer.start()
+            if self.background_finalize == 'yes':
+                self.experiment.audio_low_latency_record_finalizer = Finalizer()
+                self.experiment.audio_low_latency_record_finalizer.start()
+            if self.pretrigger_buffer > 0 or self.session_file != '':
+                self._start_capture()
+            if self.session_file != '':
+                self._start_session()
             self.experiment.cleanup_functions.append(self.close)
         elif self.dummy_mode == 'yes':
             self.experiment.audio_low_latency_record_device = None
@@ -376,8 +314,10 @@ class AudioLowLatencyRecordInit(Item):
 
         if isinstance(self.var.period_size, int):
             self.period_size = self.var.period_size
+        elif self.var.period_size == AUTO:
+            self.period_size = FALLBACK_PERIOD_SIZE
         else:
-            raise OSException('Period size value should be an integer')
+            raise OSException('Period size value should be an integer or auto')
 
         if isinstance(self.var.samplerate, int):
             self.samplerate = self.var.samplerate
@@ -391,8 +331,43 @@ class AudioLowLatencyRecordInit(Item):
 
         if isinstance(self.var.periods, int):
             self.periods = self.var.periods
+        elif self.var.periods == AUTO:
+            self.periods = FALLBACK_PERIODS
+        else:
+            raise OSException('Number of periods per buffer value should be an integer or auto')
+
+        if self.var.rt_policy in POLICIES:
+            self.rt_policy = self.var.rt_policy
+        else:
+            raise OSException(f'Scheduling policy should be one of: {", ".join(POLICIES)}')
+
+        if isinstance(self.var.rt_priority, int) and 1 <= self.var.rt_priority <= 99:
+            self.rt_priority = self.var.rt_priority
+        else:
+            raise OSException('Real-time priority should be an integer from 1 to 99')
+
+        try:
+            self.cpu_affinity = parse_cpus(self.var.cpu_affinity)
+        except ValueError:
+            raise OSException('CPU cores should be a semicolon-separated list of integers')
+
+        self.lock_memory = self.var.lock_memory
+        self.background_finalize = self.var.background_finalize
+
+        if isinstance(self.var.pretrigger_buffer, int) and self.var.pretrigger_buffer >= 0:
+            self.pretrigger_buffer = self.var.pretrigger_buffer
         else:
-            raise OSException('Number of periods per buffer value should be an integer')
+            raise OSException('Pre-trigger buffer should be an integer of 0 or larger')
+
+        self.session_file = self.var.session_file
+        if isinstance(self.var.session_segment, int) and self.var.session_segment >= 0:
+            self.session_segment = self.var.session_segment
+        else:
+            raise OSException('Session segment length should be an integer of 0 or larger')
+
+        self.auto_tune = self.var.period_size == AUTO or self.var.periods == AUTO
+        if self.auto_tune and self.module != self.pyalsaaudio_module_name:
+            raise OSException('Automatic tuning of the period size is only supported for PyAlsaAudio')
 
         if isinstance(self.var.bitdepth, int):
             if self.var.bitdepth % 8 != 0:
@@ -403,39 +378,27 @@ class AudioLowLatencyRecordInit(Item):
         else:
             raise OSException('Bit depth should be an integer')
 
-        self.buffer_size = int(self.period_size * self.periods)
         self.frame_size = int(self.samplewidth * self.channels)
-        self.data_size = int(self.frame_size * self.period_size)
-        self.period_time_exact = float(self.period_size) / float(self.samplerate) * 1000
-        self.period_time = round(self.period_time_exact, 1)
 
         self.experiment.audio_low_latency_record_dummy_mode = self.dummy_mode
         self.experiment.audio_low_latency_record_verbose = self.verbose
-        self.experiment.audio_low_latency_record_locked = 0
         self.experiment.audio_low_latency_record_module = self.module
         self.experiment.audio_low_latency_record_bitdepth = self.bitdepth
         self.experiment.audio_low_latency_record_samplewidth = self.samplewidth
         self.experiment.audio_low_latency_record_samplerate = self.samplerate
         self.experiment.audio_low_latency_record_channels = self.channels
-        self.experiment.audio_low_latency_record_period_size = self.period_size
-        self.experiment.audio_low_latency_record_data_size = self.data_size
-        self.experiment.audio_low_latency_record_period_time = self.period_time
-        if self.module == self.pyalsaaudio_module_name:
-            self.experiment.audio_low_latency_record_buffer_size = self.buffer_size
-            self.experiment.audio_low_latency_record_periods = self.periods
-            self.experiment.audio_low_latency_record_buffer_time = round(self.periods * self.period_time, 1)
+        self.experiment.audio_low_latency_record_pretrigger_buffer = self.pretrigger_buffer
 
         self.experiment.var.audio_low_latency_record_module = self.module
         self.experiment.var.audio_low_latency_record_device_name = self.device_name
-        self.experiment.var.audio_low_latency_record_period_size = self.period_size
-        if self.module == self.pyalsaaudio_module_name:
-            self.experiment.var.audio_low_latency_record_buffer_size = self.buffer_size
-            self.experiment.var.audio_low_latency_record_periods = self.periods
-            self.experiment.var.audio_low_latency_record_buffer_time = self.experiment.audio_low_latency_record_buffer_time
         self.experiment.var.audio_low_latency_record_bitdepth = self.bitdepth
         self.experiment.var.audio_low_latency_record_samplewidth = self.samplewidth
         self.experiment.var.audio_low_latency_record_samplerate = self.samplerate
         self.experiment.var.audio_low_latency_record_channels = self.channels
+        self.experiment.var.audio_low_latency_record_tuning = 'no'
+        self.experiment.audio_low_latency_record_timestamp_clock = None
+
+        self._init_period_var()
 
         # reset experimental variables
         self.experiment.audio_low_latency_record_background = None
@@ -445,9 +408,274 @@ class AudioLowLatencyRecordInit(Item):
         # self.experiment.audio_low_latency_record_pause = None
         # self.experiment.audio_low_latency_record_resume = None
 
-        self.experiment.audio_low_latency_record_thread_running = 0
+        self.experiment.audio_low_latency_record_controller = AudioController()
+        self.experiment.audio_low_latency_record_worker = None
+        self.experiment.audio_low_latency_record_writer = None
+        self.experiment.audio_low_latency_record_finalizer = None
+        self.experiment.audio_low_latency_record_capture = None
+        self.experiment.audio_low_latency_record_ring = None
+        self.experiment.audio_low_latency_record_session = None
+        self.experiment.var.audio_low_latency_record_session_files = ''
+        self.experiment.var.audio_low_latency_record_rt_policy = SCHED_OTHER
+        self.experiment.var.audio_low_latency_record_rt_priority = 0
+        self.experiment.var.audio_low_latency_record_cpu_affinity = ''
+        self.experiment.var.audio_low_latency_record_memory_locked = 'no'
+
+    def _init_period_var(self):
+        self.buffer_size = int(self.period_size * self.periods)
+        self.data_size = int(self.frame_size * self.period_size)
+        self.period_time_exact = float(self.period_size) / float(self.samplerate) * 1000
+        self.period_time = round(self.period_time_exact, 1)
+
+        self.experiment.audio_low_latency_record_period_size = self.period_size
+        self.experiment.audio_low_latency_record_data_size = self.data_size
+        self.experiment.audio_low_latency_record_period_time = self.period_time
+        if self.module == self.pyalsaaudio_module_name:
+            self.experiment.audio_low_latency_record_buffer_size = self.buffer_size
+            self.experiment.audio_low_latency_record_periods = self.periods
+            self.experiment.audio_low_latency_record_buffer_time = round(self.periods * self.period_time, 1)
+
+        self.experiment.var.audio_low_latency_record_period_size = self.period_size
+        if self.module == self.pyalsaaudio_module_name:
+            self.experiment.var.audio_low_latency_record_buffer_size = self.buffer_size
+            self.experiment.var.audio_low_latency_record_periods = self.periods
+            self.experiment.var.audio_low_latency_record_buffer_time = self.experiment.audio_low_latency_record_buffer_time
+
+    def _alsa_format(self, alsaaudio):
+        if self.bitdepth == 8:
+            return alsaaudio.PCM_FORMAT_U8
+        elif self.bitdepth == 16:
+            return alsaaudio.PCM_FORMAT_S16_LE
+        elif self.bitdepth == 24:
+            return alsaaudio.PCM_FORMAT_S24_LE
+        elif self.bitdepth == 32:
+            return alsaaudio.PCM_FORMAT_S32_LE
+        else:
+            raise ValueError('Unsupported format')
+
+    def _auto_tune(self):
+        import alsaaudio
+
+        key = tuning_key(self.device_name, CAPTURE, self.bitdepth, self.samplerate, self.channels)
+        tuned = load_tuning(key)
+        if tuned is not None and self.var.period_size in (AUTO, tuned[0]) and self.var.periods in (AUTO, tuned[1]):
+            self.period_size, self.periods = tuned
+            self._show_message(f'Using stored tuning: {self.period_size} frames, {self.periods} periods per buffer')
+            self.experiment.var.audio_low_latency_record_tuning = 'stored'
+            self._init_period_var()
+            return
+
+        self._show_message('Automatic tuning of the period size, this will take a while...')
+        format_audio = self._alsa_format(alsaaudio)
+        for period_size, periods in candidates(self.var.period_size, self.var.periods):
+            try:
+                pcm = alsaaudio.PCM(type=alsaaudio.PCM_CAPTURE,
+                                    format=format_audio,
+                                    device=self.device_name,
+                                    channels=self.channels,
+                                    rate=self.samplerate,
+                                    periodsize=period_size,
+                                    periods=periods)
+            except alsaaudio.ALSAAudioError as e:
+                self._show_message(f'{period_size} frames, {periods} periods: could not open device: {e}')
+                continue
+            try:
+                device_info = pcm.info()
+                if device_info['period_size'] != period_size or device_info['periods'] != periods:
+                    self._show_message(f'{period_size} frames, {periods} periods: not supported')
+                    continue
+                result = measure(pcm, CAPTURE, period_size, periods, self.frame_size, self.samplerate)
+            finally:
+                pcm.close()
+
+            self._show_message(f"{period_size} frames, {periods} periods: {result['xruns']} xruns, jitter {result['jitter']} ms")
+            if result['xruns'] == 0:
+                break
+        else:
+            raise OSException(f'Automatic tuning failed, no configuration without xruns found for device: {self.device_name}')
+
+        self.period_size = period_size
+        self.periods = periods
+        save_tuning(key, period_size, periods, result)
+        self._show_message(f'Tuned to {self.period_size} frames, {self.periods} periods per buffer')
+        self.experiment.var.audio_low_latency_record_tuning = 'measured'
+        self._init_period_var()
+
+    def _probe_device(self):
+        _start_time = self.clock.time()
+        try:
+            device_list, cached = cached_query_devices(self.module, CAPTURE)
+            if cached and self.device_name != '' and self.device_name not in device_list:
+                self._show_message('Device not in cached device list, refreshing cache')
+                device_list, cached = cached_query_devices(self.module, CAPTURE, refresh=True)
+        except ImportError:
+            raise OSException(f'Could not import module for {self.module}')
+        except ValueError:
+            raise OSException(f'Unknown audio module: {self.module!r}, select one of the installed modules')
+        if cached:
+            self._show_message(f'Loaded {self.module} devices from cache in {round(self.clock.time() - _start_time, 1)} ms')
+        else:
+            self._show_message(f'Probed {self.module} in {round(self.clock.time() - _start_time, 1)} ms')
+
+        if not device_list:
+            raise OSException(f'No devices found for {self.module}')
+        if self.device_name == '':
+            self.device_name = device_list[0]
+        elif self.device_name not in device_list:
+            raise OSException(f'Device {self.device_name} not found for {self.module}')
+
+        self.device_index = device_list.index(self.device_name)
+        self.experiment.audio_low_latency_record_device_dict[self.module] = device_list
+        self.experiment.var.audio_low_latency_record_device_name = self.device_name
+
+    def _verify_device_index(self, device_name_at):
+        # PortAudio device indices change with JACK/PulseAudio routing and
+        # virtual devices without the sound cards changing, so the index from
+        # the cached list is checked against the live device list
+        try:
+            name = device_name_at(self.device_index)
+        except Exception:
+            name = None
+        if name == self.device_name:
+            return
+        self._show_message('Cached device index is stale, refreshing cache')
+        device_list, cached = cached_query_devices(self.module, CAPTURE, refresh=True)
+        if self.device_name not in device_list:
+            raise OSException(f'Device {self.device_name} not found for {self.module}')
+        self.device_index = device_list.index(self.device_name)
+        self.experiment.audio_low_latency_record_device_dict[self.module] = device_list
+
+    def _discover_devices(self):
+        _start_time = self.clock.time()
+        module_list = []
+        for module_name in available_modules():
+            try:
+                device_list, cached = cached_query_devices(module_name, CAPTURE)
+            except ImportError:
+                self._show_message(f'Could not import module for {module_name}')
+                continue
+            if device_list:
+                module_list.append(module_name)
+                self.experiment.audio_low_latency_record_device_dict[module_name] = device_list
+                self.experiment.audio_low_latency_record_device_selected_dict[module_name] = device_list[0]
+        self.experiment.audio_low_latency_record_module_list = module_list
+        self._show_message(f'Enumerated all audio modules in {round(self.clock.time() - _start_time, 1)} ms')
+
+    def _setup_worker(self):
+        # runs in the worker thread, policy and affinity only apply to that thread
+        policy, priority, error = set_scheduler(self.rt_policy, self.rt_priority)
+        if error is not None:
+            self._show_message(error)
+        cpus, error = set_affinity(self.cpu_affinity)
+        if error is not None:
+            self._show_message(error)
+        self.experiment.var.audio_low_latency_record_rt_policy = policy
+        self.experiment.var.audio_low_latency_record_rt_priority = priority
+        self.experiment.var.audio_low_latency_record_cpu_affinity = ';'.join(str(cpu) for cpu in cpus)
+        self._show_message(f'Audio worker thread: {policy} with priority {priority} on CPU cores {cpus}')
+
+    def _start_capture(self):
+        # the capture stream runs for the rest of the experiment, the record
+        # items copy their frames from the ring
+        buffer_time = self.pretrigger_buffer
+        if self.session_file != '':
+            # the session recorder reads from the ring as well, the ring
+            # bridges stalls of the file system
+            buffer_time = max(buffer_time, SESSION_BUFFER)
+        frames = math.ceil(buffer_time * self.samplerate / 1000) + 2 * self.period_size
+        ring = CaptureRing(frames, self.frame_size, self.samplerate)
+        capture = ContinuousCapture(self._read_period, ring, self.clock.time, self._setup_worker)
+        capture.start()
+        capture.ready.wait()
+        self.experiment.audio_low_latency_record_ring = ring
+        self.experiment.audio_low_latency_record_capture = capture
+        self._show_message(f'Continuous capture into a {round(frames / self.samplerate * 1000)} ms ring buffer')
+
+    def _start_session(self):
+        # one recording of the whole experiment, the record items only add
+        # their start and stop to the index
+        if self.var.logfile is None:
+            raise OSException("Path to log file not found.")
+        base = os.path.normpath(os.path.join(os.path.dirname(self.var.logfile), os.path.normpath(self.session_file)))
+        os.makedirs(os.path.dirname(base) or '.', exist_ok=True)
+        path = base
+        suffix = 0
+        while os.path.exists(f'{path}_index.csv'):
+            suffix += 1
+            path = f'{base}_{suffix}'
+        session = SessionRecorder(path, self.experiment.audio_low_latency_record_ring, self.samplewidth,
+                                  self.channels, self.session_segment * self.samplerate)
+        session.start()
+        self.experiment.audio_low_latency_record_session = session
+        self._show_message(f'Recording the session to {path}, index in {session.index_file}')
+
+    def _read_period(self):
+        # runs in the capture thread, returns one period and whether the
+        # device reported an overrun; a lost period is replaced by silence so
+        # the frame indices stay aligned with the clock
+        if self.module == self.pyalsaaudio_module_name:
+            length, data = self.device.read()
+            if length < 0:
+                return bytes(self.data_size), True
+            return data, False
+        elif self.module == self.sounddevice_module_name:
+            return self.device.read(self.period_size)
+        elif self.module == self.pyaudio_module_name:
+            try:
+                return self.device.read(self.period_size), False
+            except IOError:
+                return bytes(self.data_size), True
+        return self.device.read(self.period_size), False
 
     def _reset_device(self):
+        worker = getattr(self.experiment, 'audio_low_latency_record_worker', None)
+        if worker is not None:
+            self._show_message("Stopping audio worker")
+            self.experiment.audio_low_latency_record_controller.stop()
+            worker.close()
+            worker.join()
+            self.experiment.audio_low_latency_record_worker = None
+
+        capture = getattr(self.experiment, 'audio_low_latency_record_capture', None)
+        if capture is not None:
+            self._show_message("Stopping continuous capture")
+            capture.close()
+            capture.join()
+            self.experiment.audio_low_latency_record_capture = None
+            self.experiment.audio_low_latency_record_ring = None
+
+        # ends after writing the frames that are left in the ring
+        session = getattr(self.experiment, 'audio_low_latency_record_session', None)
+        if session is not None:
+            self._show_message("Closing session recording")
+            session.join()
+            self.experiment.var.audio_low_latency_record_session_files = ';'.join(session.files)
+            if session.lost_frames:
+                self._show_message(f"Session recording lost {session.lost_frames} frames")
+            self.experiment.audio_low_latency_record_session = None
+
+        # barrier: all wave files are complete when the experiment ends,
+        # including the recording that the worker handed off when it was
+        # stopped above; the finaliser may still wait for the disk writer,
+        # so it is stopped first
+        finalizer = getattr(self.experiment, 'audio_low_latency_record_finalizer', None)
+        if finalizer is not None:
+            self._show_message('Waiting for wave files to be finalised')
+            finalizer.wait()
+            for filename, status in finalizer.failed().items():
+                self._show_message(f'{filename}: {status}')
+            self._show_message("Stopping finaliser")
+            finalizer.close()
+            finalizer.join()
+            self.experiment.audio_low_latency_record_finalizer = None
+
+        writer = getattr(self.experiment, 'audio_low_latency_record_writer', None)
+        if writer is not None:
+            self._show_message("Stopping disk writer")
+            writer.close()
+            writer.join()
+            self.experiment.audio_low_latency_record_writer = None
+
         if hasattr(self.experiment, 'audio_low_latency_record_device'):
             try:
                 self._show_message("Closing audio device")
@@ -482,6 +710,11 @@ class QtAudioLowLatencyRecordInit(AudioLowLatencyRecordInit, QtAutoPlugin):
     def init_edit_widget(self):
         super().init_edit_widget()
 
+        if not self.experiment.audio_low_latency_record_module_list:
+            self._discover_devices()
+        if not self.experiment.audio_low_latency_record_module_list:
+            raise OSException('No audio module found, install pyalsaaudio, sounddevice or PyAudio')
+
         if self.var.module in self.experiment.audio_low_latency_record_module_list:
             self.current_module = self.var.module
         else:
@@ -24,8 +24,6 @@ from libqtopensesame.items.qtautoplugin import QtAutoPlugin
 from libopensesame.exceptions import OSException
 from libopensesame.oslogging import oslogger
 
-POLL_TIME = 100
-
 
 class AudioLowLatencyRecordResume(Item):
 
@@ -40,10 +38,8 @@ class AudioLowLatencyRecordResume(Item):
         self.set_item_onset()
 
         if self.dummy_mode == 'no':
-            while not self.experiment.audio_low_latency_record_thread_running:
-                self.clock.sleep(POLL_TIME)
             self._show_message('Sending resume signal')
-            self.experiment.audio_low_latency_record_execute_pause = False
+            self.experiment.audio_low_latency_record_controller.resume()
         elif self.dummy_mode == 'yes':
             self._show_message('Dummy mode enabled, NOT recording audio')
         else:
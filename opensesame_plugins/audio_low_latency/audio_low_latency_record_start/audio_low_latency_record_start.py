@@ -24,15 +24,18 @@ from libqtopensesame.items.qtautoplugin import QtAutoPlugin
 from libopensesame.exceptions import OSException
 from libopensesame.oslogging import oslogger
 from openexp.keyboard import Keyboard
-import threading
+from opensesame_plugins.audio_low_latency.capture import CaptureBuffer, GROW_SECONDS
+from opensesame_plugins.audio_low_latency.monitor import KeyboardMonitor
+from opensesame_plugins.audio_low_latency.tracing import PeriodTrace, TRACE_FORMATS, TRACE_NO, GROW_PERIODS
+from opensesame_plugins.audio_low_latency.timing import alsa_status, portaudio_latency, portaudio_read_available, to_clock
 import wave
 import numpy
 import os
+import math
 import re
 import os.path
 
 POLL_TIME = 10
-TIMESTAMP = 0
 
 
 class AudioLowLatencyRecordStart(Item):
@@ -42,16 +45,20 @@ class AudioLowLatencyRecordStart(Item):
         self.var.file_exists_action = 'yes'
         self.var.duration = 'infinite'
         self.var.delay_start = 0
+        self.var.start_at = ''
+        self.var.pretrigger = 0
         self.var.delay_stop = 0
         self.var.pause_resume = ''
         self.var.stop = ''
         self.var.ram_cache = 'no'
+        self.var.trace = TRACE_NO
+        self.trace_count = 0
 
     def prepare(self):
         super().prepare()
         self._check_init()
         self._init_var()
-        self.kb = Keyboard(self.experiment, timeout=1)
+        self.kb = Keyboard(self.experiment, timeout=POLL_TIME)
 
         if self.pause_resume != '':
             self._allowed_responses_pause_resume = []
@@ -111,17 +118,11 @@ class AudioLowLatencyRecordStart(Item):
             raise OSException('Stop delay should be a integer')
 
         if self.dummy_mode == 'no':
-            try:
-                self._show_message('\n')
-                self._show_message(f"Creating wave file: {self.filename} ...")
-                self.wav_file = wave.open(self.filename, 'wb')
-                self._show_message('Succesfully created wave file...')
-            except Exception as e:
-                raise OSException(f"Could not create wave file\n\nMessage: {e}")
-
-            self.wav_file.setsampwidth(self.samplewidth)
-            self.wav_file.setframerate(self.samplerate)
-            self.wav_file.setnchannels(self.channels)
+            if self.session is None:
+                self._create_wave_file()
+            else:
+                self.wav_file = None
+                self._show_message(f"Adding recording to the session index {self.session.index_file}")
 
             self._show_message(f"Period size: {self.period_size} frames")
             self._show_message(f"Period size: {self.data_size} bytes")
@@ -130,6 +131,15 @@ class AudioLowLatencyRecordStart(Item):
                 self._show_message(f"Buffer consists: {self.periods} periods")
             self._show_message('')
 
+            self.capture_buffer = None
+            if self.ram_cache == 'yes' and self.session is None:
+                self._init_capture_buffer()
+
+            if self.duration_check:
+                self._init_trace(math.ceil((self.duration + self.delay_stop + self.pretrigger) / self.period_time) + 1)
+            else:
+                self._init_trace(GROW_PERIODS)
+
     def run(self):
         self._check_stop_wait()
         self.set_item_onset()
@@ -137,8 +147,17 @@ class AudioLowLatencyRecordStart(Item):
 
         if self.dummy_mode == 'no':
 
-            while self.experiment.audio_low_latency_record_locked:
-                self.clock.sleep(POLL_TIME)
+            self.controller.wait_finished()
+            # a failed job of a start item is raised by the next item
+            error = self.controller.take_error()
+            if error is not None:
+                raise OSException(f'Audio recording failed\n\nMessage: {error}')
+            self._init_start_at()
+            if self.ring is not None:
+                # the trigger is the onset of this item plus the start delay,
+                # or the scheduled start
+                trigger_time = self.start_at if self.start_at is not None else _start_time + self.delay_start
+                self.trigger_frame = self.ring.frame_at(trigger_time)
 
             if self.delay_start_check:
                 self._show_message(f"Requested audio recording delay: {self.delay_start} ms")
@@ -160,9 +179,10 @@ class AudioLowLatencyRecordStart(Item):
                 self.kb.flush()
 
             self._show_message('Initializing audio recording')
-            self.experiment.audio_low_latency_record_locked = 1
-            self.experiment.audio_low_latency_record_thread = threading.Thread(target=self._record, args=(self.device, self.wav_file, self.period_size, delay_start, delay_stop))
-            self.experiment.audio_low_latency_record_thread.start()
+            self.controller.begin()
+            self.worker.submit(self._record, self.device, self.wav_file, self.period_size, delay_start, delay_stop)
+            if self.pause_resume != '' or self.stop != '':
+                KeyboardMonitor(self.kb, self.controller, self._handle_key).start()
         elif self.dummy_mode == 'yes':
             self._set_stimulus_onset()
             self._show_message('Dummy mode enabled, NOT recording audio')
@@ -170,49 +190,57 @@ class AudioLowLatencyRecordStart(Item):
             raise OSException('Error with dummy mode!')
 
     def _record(self, stream, wav_file, chunk, delay_start, delay_stop):
-        self.experiment.audio_low_latency_record_thread_running = 1
-
         pause_duration = 0
         self.duration_exceeded = False
 
-        frames = []
-        if self.delay_start_check:
+        frames = self.capture_buffer
+        if self.ram_cache == 'no' and self.session is None:
+            self.writer.begin(wav_file)
+        if self.ring is not None:
+            self._init_cursor()
+        elif self.delay_start_check:
             if delay_start >= 1:
                 self._show_message(f"Delaying audio recording for {delay_start} ms")
                 self.clock.sleep(delay_start)
                 self._show_message('Delay done')
+        self.skip_bytes = 0
+        if self.start_at is not None and self.ring is None:
+            # start reading two periods before the target, the frames captured
+            # before it are dropped in _process_data
+            wait = self.start_at - self.clock.time() - 2 * self.period_time
+            if wait > 0:
+                self.controller.wait_stopped(wait / 1000)
         self.start_time = self._set_stimulus_onset()
+        self._set_stimulus_timing('onset_hw', 'NA')
+        self.onset_hw_pending = self.ring is None
+        self.xrun_times = []
         self._show_message('Starting audio recording')
-
-        if TIMESTAMP == 1:
-            timestamp_list = []
-            timestamp_list.append(str(self.clock.time()))
-        elif TIMESTAMP == 2:
-            self._show_message(self.clock.time())
+        # the first read of the stream is the first write to the recording
+        self.worker.first_write()
 
         while True:
-            if self.pause_resume != '' or self.stop != '':
-                self._check_keys()
-            if self.experiment.audio_low_latency_record_execute_pause == 1 and self.experiment.audio_low_latency_record_continue == 1:
+            if self.controller.paused and not self.controller.stopped:
                 self._show_message('Paused audio recording')
                 pause_start_time = self.clock.time()
-                if self.experiment.audio_low_latency_record_module == self.experiment.pyalsaaudio_module_name:
+                if self.ring is None and self.module == self.experiment.pyalsaaudio_module_name:
                     stream.pause(True)
-                while self.experiment.audio_low_latency_record_execute_pause == 1 and self.experiment.audio_low_latency_record_continue == 1:
-                    if self.pause_resume != '' or self.stop != '':
-                        self._check_keys()
+                while not self.controller.wait_resumed(self._pause_timeout()):
+                    self._skip_paused()
                     if self.duration_check:
                         if self._check_duration():
                             break
-                if self.experiment.audio_low_latency_record_module == self.experiment.pyalsaaudio_module_name:
+                if self.ring is None and self.module == self.experiment.pyalsaaudio_module_name:
                     stream.pause(False)
+                self._skip_paused()
                 self._show_message('Resumed audio recording')
                 pause_stop_time = self.clock.time()
                 pause_duration += pause_stop_time - pause_start_time
             if self.duration_check and not self.duration_exceeded:
                 self._check_duration()
-            if self.experiment.audio_low_latency_record_continue == 0 or self.duration_exceeded:
-                if delay_stop >= 1:
+            if self.controller.stopped or self.duration_exceeded:
+                if self.ring is not None:
+                    self._drain_ring(stream, wav_file, chunk, frames, delay_stop)
+                elif delay_stop >= 1:
                     stop_time = self.clock.time()
                     self._show_message(f"Initializing stopping audio recording with delay for {delay_stop} ms")
                     while self.clock.time() - stop_time <= delay_stop:
@@ -223,32 +251,73 @@ class AudioLowLatencyRecordStart(Item):
 
             self._process_data(stream, wav_file, chunk, frames)
 
-            if TIMESTAMP == 1:
-                timestamp_list.append(str(self.clock.time()))
-            elif TIMESTAMP == 2:
-                self._show_message(self.clock.time())
-
-        if self.experiment.audio_low_latency_record_module == self.experiment.pyalsaaudio_module_name:
+        if self.ring is None and self.module == self.experiment.pyalsaaudio_module_name:
             stream.drop()
             self._show_message('ALSA stream stopped')
 
-        self._set_stimulus_offset()
+        offset_time = self._set_stimulus_offset()
 
         self._show_message('Processing audio data done!')
+        self.experiment.var.audio_low_latency_record_dispatch_latency = round(self.worker.dispatch_latency, 3)
+        self._show_message(f"Dispatch latency: {self.experiment.var.audio_low_latency_record_dispatch_latency} ms")
         time_elapsed_processing = int(round(self.clock.time() - self.start_time))
         self._show_message(f"Elapsed time: {time_elapsed_processing} ms")
 
-        if self.ram_cache == 'yes':
-            self._show_message('Writing data to wav file')
-            wav_file.writeframes(b''.join(frames))
-        wav_file_nframes = self.wav_file.getnframes()
-        self.wav_duration = round(float(wav_file_nframes) / float(self.wav_file.getframerate()) * 1000, 1)
+        if self.session is not None:
+            self._mark_session()
+        else:
+            writer_result = None
+            if self.ram_cache == 'yes':
+                self.capture_buffer = None
+            elif self.ram_cache == 'no':
+                writer_result = self.writer.end()
+            if self.finalizer is not None:
+                self._show_message('Finalising wave file in the background')
+                self.finalizer.submit(self.filename, self._finalize, wav_file, frames, writer_result, self.filename)
+            else:
+                self._finalize(wav_file, frames, writer_result, self.filename)
+            # set before the trial moves on; with background finalising the
+            # periods still queued are not in the write statistics
+            if writer_result is not None:
+                self._set_writer_stats(writer_result)
 
-        wav_file.close()
         self._show_message('Finished audio recording')
-        self._show_message(f"Duration recorded wave file: {self.wav_duration} s")
-        self._show_message('Unlocking thread')
-        self.experiment.audio_low_latency_record_locked = 0
+        if self.period_trace is not None:
+            self._save_trace()
+        if self.ring is not None:
+            # overruns of the capture stream during this recording
+            self.xrun_times.extend(self.ring.time_at(frame) for frame in self.capture.xrun_frames if self.first_frame <= frame < self.cursor)
+        self._set_xruns()
+        self.controller.finish(offset_time)
+
+    def _finalize(self, wav_file, frames, writer_result, filename):
+        # runs in the record thread or in the finaliser, while the item may
+        # already be prepared for the next recording, so only the arguments
+        # describe this recording
+        if frames is not None:
+            self._show_message('Writing data to wav file')
+            wav_file.writeframes(frames.view())
+        if writer_result is not None:
+            self._show_message('Waiting for the disk writer')
+            writer_result.done.wait()
+        wav_duration = round(float(wav_file.getnframes()) / float(wav_file.getframerate()) * 1000, 1)
+        wav_file.close()
+        self._show_message(f"Duration recorded wave file {filename}: {wav_duration} ms")
+        if writer_result is not None and writer_result.error is not None:
+            raise OSException(f'Could not write wave file {filename}: {writer_result.error}')
+
+    def _create_wave_file(self):
+        try:
+            self._show_message('\n')
+            self._show_message(f"Creating wave file: {self.filename} ...")
+            self.wav_file = wave.open(self.filename, 'wb')
+            self._show_message('Succesfully created wave file...')
+        except Exception as e:
+            raise OSException(f"Could not create wave file\n\nMessage: {e}")
+
+        self.wav_file.setsampwidth(self.samplewidth)
+        self.wav_file.setframerate(self.samplerate)
+        self.wav_file.setnchannels(self.channels)
 
     def _init_var(self):
         self.dummy_mode = self.experiment.audio_low_latency_record_dummy_mode
@@ -259,6 +328,7 @@ class AudioLowLatencyRecordStart(Item):
             if self.experiment.audio_low_latency_record_module == self.experiment.pyalsaaudio_module_name:
                 self.buffer_size = self.experiment.audio_low_latency_record_buffer_size
                 self.periods = self.experiment.audio_low_latency_record_periods
+                self.timestamp_clock = self.experiment.audio_low_latency_record_timestamp_clock
         self.period_size = self.experiment.audio_low_latency_record_period_size
         self.period_time = self.experiment.audio_low_latency_record_period_time
         self.data_size = self.experiment.audio_low_latency_record_data_size
@@ -266,16 +336,43 @@ class AudioLowLatencyRecordStart(Item):
         self.samplewidth = self.experiment.audio_low_latency_record_samplewidth
         self.samplerate = self.experiment.audio_low_latency_record_samplerate
         self.channels = self.experiment.audio_low_latency_record_channels
+        self.controller = self.experiment.audio_low_latency_record_controller
+        self.writer = self.experiment.audio_low_latency_record_writer
+        self.finalizer = self.experiment.audio_low_latency_record_finalizer
+        self.ring = self.experiment.audio_low_latency_record_ring
+        self.capture = self.experiment.audio_low_latency_record_capture
+        self.session = self.experiment.audio_low_latency_record_session
+        self.worker = self.experiment.audio_low_latency_record_worker
 
         self.file_exists_action = self.var.file_exists_action
-        self.filename = self._build_output_file()
+        # the session recording replaces the file of every recording
+        self.filename = self._build_output_file() if self.session is None else None
         self.pause_resume = self.var.pause_resume
         self.stop = self.var.stop
         self.ram_cache = self.var.ram_cache
+        if isinstance(self.var.pretrigger, int) and self.var.pretrigger >= 0:
+            self.pretrigger = self.var.pretrigger
+        else:
+            raise OSException('Pre-trigger should be an integer of 0 or larger')
+        if self.dummy_mode == 'no' and self.pretrigger > 0:
+            if self.ring is None:
+                raise OSException('Pre-trigger needs a pre-trigger buffer in the Audio Low Latency Record Init item')
+            if self.session is None and self.pretrigger > self.experiment.audio_low_latency_record_pretrigger_buffer:
+                raise OSException('Pre-trigger can not be longer than the pre-trigger buffer of the Audio Low Latency Record Init item')
+        if self.var.trace in TRACE_FORMATS:
+            self.trace = self.var.trace
+        else:
+            raise OSException(f'Trace should be one of: {", ".join(TRACE_FORMATS)}')
+        self.period_trace = None
+        self.xrun_times = []
+        self.experiment.var.audio_low_latency_record_xruns = 0
+        self.experiment.var.audio_low_latency_record_xrun_timestamps = ''
+        self.experiment.var.audio_low_latency_record_trigger_sample = 'NA'
+        self.experiment.var.audio_low_latency_record_pretrigger_time = 'NA'
+        self.experiment.var.audio_low_latency_record_session_start = 'NA'
+        self.experiment.var.audio_low_latency_record_session_stop = 'NA'
         self.experiment.audio_low_latency_record_pause_resume_key = self.var.pause_resume
-        self.experiment.audio_low_latency_record_continue = 1
         self.experiment.audio_low_latency_record_start = True
-        self.experiment.audio_low_latency_record_execute_pause = 0
         self.experiment.audio_low_latency_record_stop = False
         self.experiment.audio_low_latency_record_wait = False
         self.experiment.audio_low_latency_record_pause = False
@@ -334,43 +431,260 @@ class AudioLowLatencyRecordStart(Item):
 
     def _process_data(self, stream, wav_file, chunk, frames):
         # Read data from device
-        if self.module == self.experiment.pyalsaaudio_module_name:
+        if self.ring is not None:
+            cursor = self.cursor
+            data = self._read_ring(chunk)
+            if self.session is not None and self.period_trace is not None and self.cursor > cursor:
+                # the session recorder writes the frames, the trace follows
+                # the position in the ring
+                self.period_trace.add(stream, self.clock.time())
+            if not data:
+                return
+        elif self.module == self.experiment.pyalsaaudio_module_name:
             l, data = stream.read()
+            # a negative length is an overrun, ALSA returns no data then; the
+            # period is lost, silence keeps the recording aligned
+            if l < 0:
+                self._log_xrun()
+                data = bytes(self.data_size)
+        elif self.module == self.experiment.sounddevice_module_name:
+            data, overflowed = stream.read(chunk)
+            if overflowed:
+                self._log_xrun()
+        elif self.module == self.experiment.pyaudio_module_name:
+            try:
+                data = stream.read(chunk)
+            except IOError:
+                # the period is lost, silence keeps the recording aligned
+                self._log_xrun()
+                data = bytes(self.data_size)
         else:
             data = stream.read(chunk)
-            if self.module == self.experiment.sounddevice_module_name:
-                data = numpy.frombuffer(data[0])
+        if self.period_trace is not None:
+            self.period_trace.add(stream, self.clock.time())
+        if self.onset_hw_pending:
+            self.onset_hw_pending = False
+            onset_hw = self._set_hardware_onset(stream)
+            if self.start_at is not None:
+                self._schedule(onset_hw)
+        if self.skip_bytes > 0:
+            skip = min(self.skip_bytes, len(data))
+            data = data[skip:]
+            self.skip_bytes -= skip
+        if self.module == self.experiment.sounddevice_module_name:
+            data = numpy.frombuffer(data, dtype=numpy.uint8)
 
         # save data to file/ram
         if self.ram_cache == 'yes':
             frames.append(data)
         elif self.ram_cache == 'no':
-            wav_file.writeframes(data)
-
-    def _check_keys(self):
-        key1, time1 = self.kb.get_key()
-        self.kb.flush()
+            self.writer.put(data)
+
+    def _init_cursor(self):
+        # continuous capture: the recording starts pretrigger ms before the
+        # trigger frame, or at the oldest frame that is still in the ring
+        # (in the session file)
+        oldest = self.ring.oldest() if self.session is None else self.session.first_frame
+        self.cursor = max(self.trigger_frame - round(self.pretrigger * self.samplerate / 1000), oldest)
+        self.first_frame = self.cursor
+        self.end_frame = None
+        if self.duration_check:
+            self.end_frame = self.trigger_frame + round(self.duration * self.samplerate / 1000)
+        trigger_sample = self.trigger_frame - self.cursor
+        self.experiment.var.audio_low_latency_record_trigger_sample = trigger_sample
+        self.experiment.var.audio_low_latency_record_pretrigger_time = round(trigger_sample / self.samplerate * 1000, 3)
+        self._show_message(f"Trigger at sample {trigger_sample} of the recording")
+
+    def _read_ring(self, chunk):
+        # continuous capture: copies the next period from the ring, returns
+        # no data when nothing arrived within two periods
+        if self.session is not None:
+            # the session recorder writes the frames, only the position is
+            # followed
+            position = self.ring.wait(self.cursor, 2 * self.period_time / 1000)
+            if position is None:
+                raise OSException('Continuous capture has stopped')
+            self.cursor = max(self.cursor, position)
+            if self.end_frame is not None:
+                self.cursor = min(self.cursor, self.end_frame)
+            return b''
+        count = chunk
+        if self.end_frame is not None:
+            count = min(count, self.end_frame - self.cursor)
+            if count <= 0:
+                return b''
+        start, data = self.ring.read(self.cursor, count, 2 * self.period_time / 1000)
+        if start is None:
+            raise OSException('Continuous capture has stopped')
+        if start > self.cursor:
+            # the frames were overwritten before they were read, silence
+            # keeps the trigger sample index exact
+            self._log_xrun()
+            data = bytes((start - self.cursor) * self.ring.frame_size) + data
+        self.cursor += len(data) // self.ring.frame_size
+        return data
+
+    def _drain_ring(self, stream, wav_file, chunk, frames, delay_stop):
+        # continuous capture: reads up to the frame of the stop, or the end of
+        # the duration, plus the stop delay
+        if self.duration_exceeded:
+            end_frame = self.end_frame
+        else:
+            stop_time = self.controller.stop_time if self.controller.stop_time is not None else self.clock.time()
+            end_frame = self.ring.frame_at(stop_time)
+        self.end_frame = end_frame + round(delay_stop * self.samplerate / 1000)
+        while self.cursor < self.end_frame:
+            self._process_data(stream, wav_file, chunk, frames)
+        self._show_message('Stopped audio recording')
+
+    def _mark_session(self):
+        self.session.mark(self.name, self.var.filename, self.first_frame, self.trigger_frame, self.cursor)
+        self.experiment.var.audio_low_latency_record_session_start = self.first_frame - self.session.first_frame
+        self.experiment.var.audio_low_latency_record_session_stop = self.cursor - self.session.first_frame
+        self._show_message(f"Session samples {self.experiment.var.audio_low_latency_record_session_start} to {self.experiment.var.audio_low_latency_record_session_stop}")
+
+    def _skip_paused(self):
+        # the continuous capture keeps running while paused, the frames
+        # captured meanwhile are dropped
+        if self.ring is not None:
+            self.cursor = max(self.cursor, self.ring.position)
+
+    def _set_hardware_onset(self, stream):
+        # called after reading the first period, the onset is the time its
+        # first frame was captured by the ADC
+        if self.module == self.experiment.pyalsaaudio_module_name:
+            status = None
+            if self.timestamp_clock is not None:
+                status = alsa_status(stream)
+            if status is None:
+                return None
+            timestamp, avail = status
+            onset_hw = to_clock(self.clock.time, self.timestamp_clock, timestamp - (avail + self.period_size) / self.samplerate)
+        elif self.module in [self.experiment.pyaudio_module_name, self.experiment.sounddevice_module_name]:
+            frames = portaudio_read_available(stream) + self.period_size
+            onset_hw = self.clock.time() - (portaudio_latency(stream, False) + frames / self.samplerate) * 1000
+        else:
+            return None
+        self._set_stimulus_timing('onset_hw', onset_hw)
+        self._show_message(f"Hardware onset: {round(onset_hw - self.start_time, 3)} ms after onset")
+        return onset_hw
+
+    def _init_trace(self, periods):
+        # the trace array is allocated here, the recording loop only fills in rows
+        self.period_trace = None
+        if self.trace == TRACE_NO:
+            return
+        if self.var.logfile is None:
+            raise OSException("Path to log file not found.")
+        self.trace_count += 1
+        self.trace_path = f"{os.path.splitext(self.var.logfile)[0]}_{self.name}_{self.trace_count}"
+        self.period_trace = PeriodTrace(periods, self.module, False, getattr(self, 'buffer_size', None))
+
+    def _save_trace(self):
+        mean, sd, maximum = self.period_trace.statistics()
+        self.experiment.var.audio_low_latency_record_period_interval = round(mean, 3)
+        self.experiment.var.audio_low_latency_record_jitter_sd = round(sd, 3)
+        self.experiment.var.audio_low_latency_record_jitter_max = round(maximum, 3)
+        filename = self.period_trace.save(self.trace_path, self.trace)
+        self.experiment.var.audio_low_latency_record_trace_file = filename
+        self._show_message(f"Period interval: {round(mean, 3)} ms, jitter SD {round(sd, 3)} ms, max {round(maximum, 3)} ms")
+        self._show_message(f"Saved trace of {self.period_trace.count} periods to {filename}")
+
+    def _init_capture_buffer(self):
+        # allocated here so the capture loop only copies periods into it
+        frame_size = self.samplewidth * self.channels
+        grow_size = GROW_SECONDS * self.samplerate * frame_size
+        if self.duration_check:
+            frames = math.ceil((self.duration + self.delay_stop + self.pretrigger) * self.samplerate / 1000) + 2 * self.period_size
+            size = frames * frame_size
+        else:
+            size = grow_size
+        _start_time = self.clock.time()
+        self.capture_buffer = CaptureBuffer(size, grow_size)
+        self._show_message(f"Allocated {round(size / 1048576, 1)} MB capture buffer in {round(self.clock.time() - _start_time, 1)} ms")
+
+    def _set_writer_stats(self, result):
+        write_times = list(result.write_times)
+        self.experiment.var.audio_low_latency_record_queue_high_water = result.high_water
+        self.experiment.var.audio_low_latency_record_writes = len(write_times)
+        self.experiment.var.audio_low_latency_record_write_latency_mean = round(sum(write_times) / len(write_times), 3) if write_times else 0
+        self.experiment.var.audio_low_latency_record_write_latency_max = round(max(write_times), 3) if write_times else 0
+        self._show_message(f"Disk writer: {len(write_times)} writes, max {self.experiment.var.audio_low_latency_record_write_latency_max} ms, queue high water {result.high_water} periods")
+
+    def _log_xrun(self):
+        self.xrun_times.append(self.clock.time())
+
+    def _set_xruns(self):
+        self.experiment.var.audio_low_latency_record_xruns = len(self.xrun_times)
+        self.experiment.var.audio_low_latency_record_xrun_timestamps = ''.join(f"{time};" for time in self.xrun_times)
+        if self.xrun_times:
+            self._show_message(f"Detected {len(self.xrun_times)} overrun(s)")
+
+    def _init_start_at(self):
+        # read at run time, the target is usually computed from a timestamp
+        # of the current trial
+        self.experiment.var.audio_low_latency_record_schedule_error = 'NA'
+        if self.var.start_at == '':
+            self.start_at = None
+        elif isinstance(self.var.start_at, (int, float)):
+            if self.delay_start_check:
+                raise OSException('Start delay and start time can not be combined')
+            self.start_at = float(self.var.start_at)
+            self._show_message(f"Scheduled audio recording at {self.start_at} ms")
+        else:
+            raise OSException(f'Start time should be empty or a clock time in ms, e.g. {{time_sync + 1000}}, not: {self.var.start_at}')
+
+    def _schedule(self, onset):
+        # drop the frames captured before start_at, onset is the capture
+        # time of the first frame read
+        hardware = onset is not None
+        if not hardware:
+            onset = self.clock.time() - self.period_size / self.samplerate * 1000
+        frames = round((self.start_at - onset) * self.samplerate / 1000)
+        if frames < 0:
+            self._show_message(f"Scheduled start missed by {round(-frames / self.samplerate * 1000, 3)} ms")
+            frames = 0
+        self.skip_bytes = frames * self.samplewidth * self.channels
+        onset += frames / self.samplerate * 1000
+        if hardware:
+            self._set_stimulus_timing('onset_hw', onset)
+        self.experiment.var.audio_low_latency_record_schedule_error = round(onset - self.start_at, 3)
+        self._show_message(f"Dropping {frames} frames captured before the scheduled start")
+
+    def _handle_key(self, key1, time1):
+        # called by the keyboard monitor thread
         if self.stop != '':
             if key1 in self._allowed_responses_stop:
                 self._show_message('Detected key press for stopping audio')
                 self._log_keys(key1,str(time1))
-                self.experiment.audio_low_latency_record_continue = 0
+                self.controller.stop(time1)
         if self.pause_resume != '':
             if key1 in self._allowed_responses_pause_resume:
                 self._log_keys(key1,str(time1))
-                if self.experiment.audio_low_latency_record_execute_pause == 0:
+                if self.controller.toggle_pause():
                     self._show_message('Detected key press for pausing audio recording')
-                    self.experiment.audio_low_latency_record_execute_pause = 1
-                elif self.experiment.audio_low_latency_record_execute_pause == 1:
+                else:
                     self._show_message('Detected key press for resuming audio recording')
-                    self.experiment.audio_low_latency_record_execute_pause = 0
 
     def _log_keys(self, key1, time1):
         self.experiment.var.audio_low_latency_record_start_key_presses += f"{key1};"
         self.experiment.var.audio_low_latency_record_start_key_timestamps += f"{time1};"
 
+    def _pause_timeout(self):
+        # wake up at the end of the duration while paused
+        if not self.duration_check:
+            return None
+        if self.ring is not None:
+            return max(self.end_frame - self.ring.position, self.period_size) / self.samplerate
+        return max(0, self.duration - (self.clock.time() - self.start_time)) / 1000
+
     def _check_duration(self):
-        if self.clock.time() - self.start_time >= self.duration:
+        if self.ring is not None:
+            # continuous capture counts the frames from the trigger
+            exceeded = self.cursor >= self.end_frame
+        else:
+            exceeded = self.clock.time() - self.start_time >= self.duration
+        if exceeded:
             self._show_message('Stopping audio recording, duration exceeded')
             self.duration_exceeded = True
             return True
@@ -24,8 +24,6 @@ from libqtopensesame.items.qtautoplugin import QtAutoPlugin
 from libopensesame.exceptions import OSException
 from libopensesame.oslogging import oslogger
 
-POLL_TIME = 100
-
 
 class AudioLowLatencyRecordWait(Item):
 
@@ -39,11 +37,9 @@ class AudioLowLatencyRecordWait(Item):
         self.set_item_onset()
 
         if self.dummy_mode == 'no':
-            while not self.experiment.audio_low_latency_record_thread_running:
-                self.clock.sleep(POLL_TIME)
-            if self.experiment.audio_low_latency_record_locked:
-                self.experiment.audio_low_latency_record_thread.join()
-            self.experiment.audio_low_latency_record_thread_running = 0
+            controller = self.experiment.audio_low_latency_record_controller
+            controller.wait_finished()
+            self._check_error(controller)
         elif self.dummy_mode == 'yes':
             self._show_message('Dummy mode enabled, NOT recording audio')
         else:
@@ -59,6 +55,11 @@ class AudioLowLatencyRecordWait(Item):
             raise OSException(
                 'Audio Low Latency Record Start item is missing')
 
+    def _check_error(self, controller):
+        error = controller.take_error()
+        if error is not None:
+            raise OSException(f'Audio recording failed\n\nMessage: {error}')
+
     def _check_init(self):
         if not hasattr(self.experiment, 'audio_low_latency_record_device'):
             raise OSException(
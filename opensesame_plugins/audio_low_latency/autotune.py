@@ -0,0 +1,107 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import math
+import time
+
+from opensesame_plugins.audio_low_latency.cache import load_cache, save_cache
+from opensesame_plugins.audio_low_latency.devices import device_fingerprint, PLAYBACK, PYALSAAUDIO_MODULE_NAME
+
+AUTO = 'auto'
+PERIOD_SIZES = [64, 128, 256, 512, 1024, 2048]
+PERIODS = [2, 3, 4, 8]
+TUNE_TIME = 2000
+FALLBACK_PERIOD_SIZE = 1024
+FALLBACK_PERIODS = 4
+TUNING_CACHE_NAME = 'tuning'
+
+
+def tuning_key(device_name, direction, bitdepth, samplerate, channels):
+    return f'{direction}:{device_name}:{bitdepth}:{samplerate}:{channels}'
+
+
+def load_tuning(key):
+    """Returns the stored (period_size, periods) for key, or None when the
+    device was not tuned or the sound cards have changed since."""
+    entry = load_cache(TUNING_CACHE_NAME).get(key)
+    if not isinstance(entry, dict) or entry.get('fingerprint') != device_fingerprint(PYALSAAUDIO_MODULE_NAME):
+        return None
+    return entry['period_size'], entry['periods']
+
+
+def save_tuning(key, period_size, periods, result):
+    cache = load_cache(TUNING_CACHE_NAME)
+    cache[key] = {'fingerprint': device_fingerprint(PYALSAAUDIO_MODULE_NAME),
+                  'period_size': period_size,
+                  'periods': periods,
+                  'xruns': result['xruns'],
+                  'jitter': result['jitter']}
+    save_cache(TUNING_CACHE_NAME, cache)
+
+
+def candidates(period_size=AUTO, periods=AUTO):
+    """Returns the (period_size, periods) combinations to try, smallest
+    buffer first. A value other than auto is kept fixed."""
+    period_sizes = PERIOD_SIZES if period_size == AUTO else [period_size]
+    periods_list = PERIODS if periods == AUTO else [periods]
+    combinations = [(ps, p) for ps in period_sizes for p in periods_list]
+    return sorted(combinations, key=lambda c: (c[0] * c[1], c[0]))
+
+
+def measure(pcm, direction, period_size, periods, frame_size, samplerate, tune_time=TUNE_TIME):
+    """Writes silence to (or reads from) an opened ALSA pcm for tune_time ms
+    and returns a dict with the number of xruns and the jitter of the
+    write/read return times in ms.
+
+    pyalsaaudio recovers from a playback underrun inside write() without
+    reporting it, so a write that returns later than a buffer time after
+    the previous one is counted as an underrun, as in the play items."""
+    silence = bytes(period_size * frame_size)
+    n_periods = int(math.ceil(tune_time / 1000 * samplerate / period_size))
+    buffer_time = period_size * periods / samplerate * 1000
+    intervals = []
+    xruns = 0
+
+    last_time = time.perf_counter()
+    for _ in range(n_periods):
+        if direction == PLAYBACK:
+            length = pcm.write(silence)
+        else:
+            length, data = pcm.read()
+        now = time.perf_counter()
+        interval = (now - last_time) * 1000
+        if length < 0:
+            xruns += 1
+        elif direction == PLAYBACK and interval > buffer_time:
+            xruns += 1
+        intervals.append(interval)
+        last_time = now
+
+    if direction == PLAYBACK:
+        pcm.drop()
+        # the first writes only fill the buffer and return immediately
+        intervals = intervals[periods:]
+
+    if len(intervals) > 1:
+        mean = sum(intervals) / len(intervals)
+        jitter = math.sqrt(sum((i - mean) ** 2 for i in intervals) / (len(intervals) - 1))
+    else:
+        jitter = 0.0
+    return {'xruns': xruns, 'jitter': round(jitter, 3)}
@@ -0,0 +1,61 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import os
+import json
+
+CACHE_FOLDER_NAME = 'opensesame-plugin-audio_low_latency'
+
+
+def cache_folder():
+    """Returns the per-user cache folder of the plug-in."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, CACHE_FOLDER_NAME)
+
+
+def load_cache(name):
+    """Returns the cached dict stored under name, or an empty dict when it
+    does not exist or can not be read."""
+    path = os.path.join(cache_folder(), f'{name}.json')
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return data
+
+
+def save_cache(name, data):
+    """Stores data under name, a failure to write is silently ignored."""
+    folder = cache_folder()
+    path = os.path.join(folder, f'{name}.json')
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(folder, exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
@@ -0,0 +1,153 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import threading
+
+BLOCKING = 'blocking'
+CALLBACK = 'callback'
+ENGINES = [BLOCKING, CALLBACK]
+
+
+class CallbackEngine:
+    """Feeds a PortAudio output stream from its callback. The callback pulls
+    the frames of the current sound from a preloaded buffer and writes
+    silence when nothing is playing or playback is paused.
+
+    Times are taken with clock (the OpenSesame clock, in ms) inside the
+    callback. onset_time is the callback that handed over the first frame,
+    onset_hw_time and offset_time are corrected with the outputBufferDacTime
+    reported by PortAudio and refer to the moment the first and last frame
+    reach the DAC.
+    """
+
+    def __init__(self, frame_size, samplerate, clock):
+        self.frame_size = frame_size
+        self.samplerate = samplerate
+        self.clock = clock
+        self.controller = None
+        self.onset_time = None
+        self.onset_hw_time = None
+        self.offset_time = None
+        self.paused_frames = 0
+        self.callbacks = 0
+        self.xrun_times = []
+        self._data = b''
+        self._size = 0
+        self._start_time = None
+        self._position = 0
+        self._playing = False
+        self._finished = threading.Event()
+        self._finished.set()
+        self._pa_output_underflow = None
+        self._pa_continue = None
+
+    def play(self, data, size, controller, start_time=None):
+        """Starts playing data from the next callback. size is the total
+        number of bytes to play, data is padded with silence up to size.
+        With a start_time the first frame reaches the DAC at that clock
+        time, to the sample."""
+        self._finished.clear()
+        self.controller = controller
+        self.onset_time = None
+        self.onset_hw_time = None
+        self.offset_time = None
+        self.paused_frames = 0
+        self.callbacks = 0
+        self.xrun_times = []
+        self._data = data
+        self._size = size
+        self._start_time = start_time
+        self._position = 0
+        self._playing = True
+
+    def wait(self, timeout=None):
+        """Blocks until the last frame has been passed to PortAudio or
+        playback was stopped, returns False on a timeout."""
+        return self._finished.wait(timeout)
+
+    def sounddevice_callback(self, outdata, frames, time, status):
+        if status.output_underflow:
+            self._xrun()
+        outdata[:] = self._next(frames, self._dac_delay(time.outputBufferDacTime, time.currentTime))
+
+    def use_pyaudio(self, pyaudio):
+        """Keeps the PyAudio flags, so the callback does not have to import
+        the module for every period. Call before opening the stream."""
+        self._pa_output_underflow = pyaudio.paOutputUnderflow
+        self._pa_continue = pyaudio.paContinue
+
+    def pyaudio_callback(self, in_data, frame_count, time_info, status):
+        if status & self._pa_output_underflow:
+            self._xrun()
+        chunk = self._next(frame_count, self._dac_delay(time_info['output_buffer_dac_time'], time_info['current_time']))
+        return bytes(chunk), self._pa_continue
+
+    def _xrun(self):
+        # PortAudio reports the underrun in the callback after it happened
+        if self._playing:
+            self.xrun_times.append(self.clock())
+
+    def _dac_delay(self, dac_time, current_time):
+        # some host APIs do not report stream times
+        if dac_time <= 0 or current_time <= 0 or dac_time < current_time:
+            return 0
+        return (dac_time - current_time) * 1000
+
+    def _next(self, frames, dac_delay):
+        nbytes = frames * self.frame_size
+        if not self._playing:
+            return bytes(nbytes)
+
+        now = self.clock()
+        self.callbacks += 1
+        controller = self.controller
+        if controller.stopped:
+            self._finish(now + dac_delay)
+            return bytes(nbytes)
+        if controller.paused:
+            self.paused_frames += frames
+            return bytes(nbytes)
+
+        lead = 0
+        if self.onset_time is None:
+            if self._start_time is not None:
+                # frames of silence in this buffer before the scheduled onset
+                lead = round((self._start_time - now - dac_delay) * self.samplerate / 1000)
+                if lead >= frames:
+                    return bytes(nbytes)
+                lead = max(0, lead)
+            self.onset_time = now
+            self.onset_hw_time = now + dac_delay + lead / self.samplerate * 1000
+        lead_size = lead * self.frame_size
+        size = nbytes - lead_size
+        chunk = self._data[self._position:self._position + size]
+        self._position += size
+        if lead_size or len(chunk) < size:
+            chunk = bytes(lead_size) + bytes(chunk) + bytes(size - len(chunk))
+        if self._position >= self._size:
+            # the last frame of the sound leaves the DAC at the end of this buffer
+            length = nbytes - (self._position - self._size)
+            self._finish(now + dac_delay + length / self.frame_size / self.samplerate * 1000)
+        return chunk
+
+    def _finish(self, offset_time):
+        self._playing = False
+        self.offset_time = offset_time
+        self._finished.set()
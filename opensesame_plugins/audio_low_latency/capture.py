@@ -0,0 +1,154 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import threading
+import numpy
+
+GROW_SECONDS = 60
+EPOCH_PERIODS = 32
+
+
+class CaptureBuffer:
+    """Preallocated buffer for a recording that is kept in RAM. Every period
+    is copied once into the buffer, the pages are touched when the buffer
+    is allocated so the capture loop does not page fault.
+
+    When a recording is longer than planned, the buffer grows by
+    grow_size bytes at a time.
+    """
+
+    def __init__(self, size, grow_size):
+        self.grow_size = grow_size
+        self.size = 0
+        self.data = self._allocate(size)
+        self._view = memoryview(self.data)
+
+    def append(self, data):
+        end = self.size + len(data)
+        if end > len(self.data):
+            self._grow(end)
+        # a memoryview copies bytes about three times faster than numpy
+        self._view[self.size:end] = data
+        self.size = end
+
+    def view(self):
+        """Returns the captured bytes without copying them."""
+        return memoryview(self.data[:self.size])
+
+    def _grow(self, size):
+        data = self._allocate(max(size, len(self.data) + self.grow_size))
+        data[:self.size] = self.data[:self.size]
+        self.data = data
+        self._view = memoryview(self.data)
+
+    def _allocate(self, size):
+        data = numpy.empty(size, dtype=numpy.uint8)
+        data.fill(0)
+        return data
+
+
+class CaptureRing:
+    """Circular buffer with the last frames of a capture stream that runs
+    for the whole experiment. Frames are addressed by their index since the
+    stream was started, so a recording can begin with frames that were
+    captured before it was triggered.
+
+    The capture thread writes whole periods, the record items copy frames
+    out with read(). Frame indices are mapped to clock times with the
+    epoch, the clock time of frame 0. A read that returns late only makes
+    the frames look younger, so the epoch is the earliest estimate of the
+    last EPOCH_PERIODS periods, which also follows drift between the audio
+    and system clock.
+    """
+
+    def __init__(self, frames, frame_size, samplerate):
+        self.frames = frames
+        self.frame_size = frame_size
+        self.samplerate = samplerate
+        self.position = 0
+        self.epoch = None
+        self.closed = False
+        self.data = numpy.empty(frames * frame_size, dtype=numpy.uint8)
+        self.data.fill(0)
+        self._view = memoryview(self.data)
+        self._epochs = numpy.full(EPOCH_PERIODS, numpy.inf)
+        self._writes = 0
+        self._condition = threading.Condition()
+
+    def write(self, data, time):
+        data = memoryview(data).cast('B')
+        with self._condition:
+            start = self.position * self.frame_size % len(self.data)
+            first = min(len(data), len(self.data) - start)
+            self._view[start:start + first] = data[:first]
+            self._view[:len(data) - first] = data[first:]
+            self.position += len(data) // self.frame_size
+            self._epochs[self._writes % EPOCH_PERIODS] = time - self.position / self.samplerate * 1000
+            self._writes += 1
+            self.epoch = self._epochs.min()
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def oldest(self):
+        return max(0, self.position - self.frames)
+
+    def frame_at(self, time):
+        """Returns the index of the frame captured at clock time, which can
+        be in the future."""
+        with self._condition:
+            if self.epoch is None:
+                return 0
+            return round((time - self.epoch) * self.samplerate / 1000)
+
+    def time_at(self, frame):
+        with self._condition:
+            return self.epoch + frame / self.samplerate * 1000
+
+    def wait(self, frame, timeout=None):
+        """Waits until the capture thread has written frame, returns the
+        position, which is None when the capture has stopped."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.position > frame or self.closed, timeout)
+            if self.closed and self.position <= frame:
+                return None
+            return self.position
+
+    def read(self, start, frames, timeout=None):
+        """Copies up to frames frames from frame start on, waiting until the
+        capture thread has written it. Returns the index of the first frame
+        and the bytes, which are empty on a timeout. Frames that were
+        already overwritten are skipped, so the index can be larger than
+        start. The index is None when the capture has stopped."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.position > start or self.closed, timeout):
+                return start, b''
+            if self.position <= start:
+                return None, b''
+            start = max(start, self.position - self.frames)
+            count = min(frames, self.position - start)
+            begin = start * self.frame_size % len(self.data)
+            end = begin + count * self.frame_size
+            if end <= len(self.data):
+                return start, bytes(self._view[begin:end])
+            return start, bytes(self._view[begin:]) + bytes(self._view[:end - len(self.data)])
@@ -0,0 +1,68 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import threading
+
+from libopensesame.oslogging import oslogger
+
+
+class ContinuousCapture(threading.Thread):
+    """Long-lived thread that keeps reading the capture stream into a
+    CaptureRing from the init item on, so the record items do not start
+    the stream and can include frames from before their trigger.
+
+    read returns the bytes of one period and whether the device reported
+    an overrun, xrun_frames holds the ring positions of those overruns.
+    initializer is called in the thread before the first read.
+    """
+
+    def __init__(self, read, ring, clock, initializer=None):
+        super().__init__(name='audio_low_latency_capture', daemon=True)
+        self.read = read
+        self.ring = ring
+        self.clock = clock
+        self.initializer = initializer
+        self.xrun_frames = []
+        self.ready = threading.Event()
+        self._closing = threading.Event()
+
+    def close(self):
+        self._closing.set()
+
+    def run(self):
+        try:
+            if self.initializer is not None:
+                self.initializer()
+        except Exception as e:
+            oslogger.error(f'Capture thread setup failed: {e}')
+        finally:
+            self.ready.set()
+
+        try:
+            while not self._closing.is_set():
+                data, overrun = self.read()
+                if overrun:
+                    self.xrun_frames.append(self.ring.position)
+                self.ring.write(data, self.clock())
+        except Exception as e:
+            oslogger.error(f'Continuous capture failed: {e}')
+        finally:
+            # wakes up a recording that waits for frames
+            self.ring.close()
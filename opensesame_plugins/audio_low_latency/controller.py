@@ -0,0 +1,117 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import threading
+
+
+class AudioController:
+    """Signals stop and pause/resume requests to a play or record thread and
+    lets the control items wait for that thread without polling.
+
+    A session starts with begin(), before the thread is started, and ends
+    when the thread calls finish(), or fail() with the exception that ended
+    it. The exception is kept until an item takes it with take_error().
+    session counts the sessions, so helpers can tell theirs from the next.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._finished = threading.Event()
+        self._finished.set()
+        self.stopped = False
+        self.paused = False
+        self.stop_time = None
+        self.offset_time = None
+        self.error = None
+        self.session = 0
+
+    @property
+    def active(self):
+        return not self._finished.is_set()
+
+    def begin(self):
+        with self._condition:
+            self.stopped = False
+            self.paused = False
+            self.stop_time = None
+            self.offset_time = None
+            self.error = None
+            self.session += 1
+            self._finished.clear()
+
+    def finish(self, offset_time=None):
+        with self._condition:
+            self.offset_time = offset_time
+            self._finished.set()
+            self._condition.notify_all()
+
+    def fail(self, error):
+        with self._condition:
+            self.error = error
+            self._finished.set()
+            self._condition.notify_all()
+
+    def take_error(self):
+        """Returns the exception of a failed session once, or None."""
+        with self._condition:
+            error = self.error
+            self.error = None
+            return error
+
+    def stop(self, time=None):
+        with self._condition:
+            self.stopped = True
+            self.stop_time = time
+            self._condition.notify_all()
+
+    def pause(self):
+        with self._condition:
+            self.paused = True
+            self._condition.notify_all()
+
+    def resume(self):
+        with self._condition:
+            self.paused = False
+            self._condition.notify_all()
+
+    def toggle_pause(self):
+        """Pauses a running session or resumes a paused one, returns True
+        when the session is paused afterwards."""
+        with self._condition:
+            self.paused = not self.paused
+            self._condition.notify_all()
+            return self.paused
+
+    def wait_resumed(self, timeout=None):
+        """Blocks while the session is paused and not stopped, returns False
+        on a timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self.paused or self.stopped, timeout)
+
+    def wait_stopped(self, timeout=None):
+        """Blocks until the session is stopped, returns False on a
+        timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.stopped, timeout)
+
+    def wait_finished(self, timeout=None):
+        """Blocks until the current session has finished, returns False on a
+        timeout."""
+        return self._finished.wait(timeout)
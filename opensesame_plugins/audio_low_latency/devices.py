@@ -0,0 +1,158 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import os
+import hashlib
+import importlib.util
+
+from opensesame_plugins.audio_low_latency.cache import load_cache, save_cache
+
+MODULES_ENABLED = ['alsaaudio', 'sounddevice', 'pyaudio']
+
+PYALSAAUDIO_MODULE_NAME = 'PyAlsaAudio (Linux only)'
+OSS4_MODULE_NAME = 'ossaudiodev (Linux only)'
+PYAUDIO_MODULE_NAME = 'PyAudio (PortAudio)'
+SOUNDDEVICE_MODULE_NAME = 'SoundDevice (PortAudio)'
+
+# module names with their python package, in the order they are listed in the GUI
+MODULE_PACKAGES = {
+    PYALSAAUDIO_MODULE_NAME: 'alsaaudio',
+    OSS4_MODULE_NAME: 'ossaudiodev',
+    SOUNDDEVICE_MODULE_NAME: 'sounddevice',
+    PYAUDIO_MODULE_NAME: 'pyaudio',
+}
+
+# order of preference for the default module
+MODULES_PREFERRED = [PYALSAAUDIO_MODULE_NAME, SOUNDDEVICE_MODULE_NAME, PYAUDIO_MODULE_NAME, OSS4_MODULE_NAME]
+
+POSIX_ONLY = [PYALSAAUDIO_MODULE_NAME, OSS4_MODULE_NAME]
+
+# distribution names used for the library version in the device cache key
+MODULE_DISTRIBUTIONS = {
+    PYALSAAUDIO_MODULE_NAME: 'pyalsaaudio',
+    SOUNDDEVICE_MODULE_NAME: 'sounddevice',
+    PYAUDIO_MODULE_NAME: 'PyAudio',
+}
+
+ASOUND_CARDS = '/proc/asound/cards'
+DEVICE_CACHE_NAME = 'devices'
+
+PLAYBACK = 'play'
+CAPTURE = 'record'
+
+
+def available_modules():
+    """Returns the enabled module names whose package is installed, without
+    importing the package or probing any device."""
+    module_list = []
+    for module_name, package in MODULE_PACKAGES.items():
+        if package not in MODULES_ENABLED:
+            continue
+        if module_name in POSIX_ONLY and os.name != 'posix':
+            continue
+        try:
+            if importlib.util.find_spec(package) is None:
+                continue
+        except (ImportError, ValueError):
+            continue
+        module_list.append(module_name)
+    return module_list
+
+
+def default_module(module_list):
+    """Returns the preferred module from module_list, or an empty string."""
+    for module_name in MODULES_PREFERRED:
+        if module_name in module_list:
+            return module_name
+    return ''
+
+
+def query_devices(module_name, direction):
+    """Imports the package for module_name and returns its device names.
+
+    For the PortAudio modules the list contains all devices, so that the list
+    index equals the PortAudio device index. Raises ImportError when the
+    package is not available.
+    """
+    if module_name == PYALSAAUDIO_MODULE_NAME:
+        import alsaaudio
+        if direction == PLAYBACK:
+            return alsaaudio.pcms(alsaaudio.PCM_PLAYBACK)
+        return alsaaudio.pcms(alsaaudio.PCM_CAPTURE)
+
+    if module_name == OSS4_MODULE_NAME:
+        if importlib.util.find_spec('ossaudiodev') is None:
+            raise ImportError('No module named ossaudiodev')
+        return ['Exclusive Mode', 'Shared Mode']
+
+    if module_name == SOUNDDEVICE_MODULE_NAME:
+        import sounddevice
+        return [card['name'] for card in sounddevice.query_devices()]
+
+    if module_name == PYAUDIO_MODULE_NAME:
+        import pyaudio
+        pyaudio_device = pyaudio.PyAudio()
+        try:
+            return [pyaudio_device.get_device_info_by_index(di)['name']
+                    for di in range(0, pyaudio_device.get_device_count())]
+        finally:
+            pyaudio_device.terminate()
+
+    raise ValueError(f'Unknown module: {module_name}')
+
+
+def device_fingerprint(module_name):
+    """Returns a hash of the library version of module_name and the list of
+    sound cards, which changes whenever the device list can have changed."""
+    version = ''
+    distribution = MODULE_DISTRIBUTIONS.get(module_name)
+    if distribution is not None:
+        try:
+            import importlib.metadata
+            version = importlib.metadata.version(distribution)
+        except Exception:
+            version = ''
+    try:
+        with open(ASOUND_CARDS, 'r') as f:
+            cards = f.read()
+    except OSError:
+        cards = ''
+    return hashlib.sha1(f'{module_name}\n{version}\n{cards}'.encode()).hexdigest()
+
+
+def cached_query_devices(module_name, direction, refresh=False):
+    """Same as query_devices, but the device list is taken from the on-disk
+    cache when the fingerprint of module_name is unchanged.
+
+    Returns a tuple with the device list and a boolean that is True when the
+    list came from the cache.
+    """
+    key = f'{direction}:{module_name}'
+    fingerprint = device_fingerprint(module_name)
+    cache = load_cache(DEVICE_CACHE_NAME)
+    entry = cache.get(key)
+    if not refresh and isinstance(entry, dict) and entry.get('fingerprint') == fingerprint:
+        return list(entry['devices']), True
+
+    device_list = query_devices(module_name, direction)
+    cache = load_cache(DEVICE_CACHE_NAME)
+    cache[key] = {'fingerprint': fingerprint, 'devices': device_list}
+    save_cache(DEVICE_CACHE_NAME, cache)
+    return device_list, False
@@ -0,0 +1,80 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import queue
+import threading
+
+from libopensesame.oslogging import oslogger
+
+PENDING = 'pending'
+DONE = 'done'
+
+
+class Finalizer(threading.Thread):
+    """Long-lived thread that finalises recorded wave files (writing the
+    RAM buffer, flushing, patching the header and closing), so the record
+    thread can finish as soon as the capture has stopped.
+
+    status maps every submitted file name to pending, done or an error
+    message. wait() is a barrier that returns when all submitted files
+    have been finalised.
+    """
+
+    def __init__(self):
+        super().__init__(name='audio_low_latency_finalizer', daemon=True)
+        self.status = {}
+        self._jobs = queue.Queue()
+        self._condition = threading.Condition()
+        self._pending = 0
+
+    def submit(self, filename, function, *args):
+        with self._condition:
+            self._pending += 1
+            self.status[filename] = PENDING
+        self._jobs.put((filename, function, args))
+
+    def wait(self, timeout=None):
+        """Blocks until all submitted files are finalised, returns False on
+        a timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending == 0, timeout)
+
+    def failed(self):
+        return {filename: status for filename, status in self.status.items() if status not in (PENDING, DONE)}
+
+    def close(self):
+        self._jobs.put(None)
+
+    def run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            filename, function, args = job
+            try:
+                function(*args)
+                status = DONE
+            except Exception as e:
+                oslogger.error(f'Could not finalise {filename}: {e}')
+                status = f'error: {e}'
+            with self._condition:
+                self.status[filename] = status
+                self._pending -= 1
+                self._condition.notify_all()
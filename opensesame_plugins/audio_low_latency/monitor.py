@@ -0,0 +1,52 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import threading
+
+
+class KeyboardMonitor(threading.Thread):
+    """Polls the keyboard in its own thread while a session of controller is
+    running, so the audio thread only has to do I/O. Every key press is
+    passed to callback with its timestamp; the callback signals the audio
+    thread through the controller.
+
+    The monitor belongs to the session that is running when it is created.
+    The timeout of the keyboard determines how long it can keep running
+    after that session has ended. A key press that arrives after the next
+    session has begun is dropped, so the monitor never acts on a session
+    that it was not started for.
+    """
+
+    def __init__(self, kb, controller, callback):
+        super().__init__(name='audio_low_latency_keyboard', daemon=True)
+        self.kb = kb
+        self.controller = controller
+        self.callback = callback
+        self.session = controller.session
+
+    def run(self):
+        while self._running():
+            key, time = self.kb.get_key()
+            if key is not None and self._running():
+                self.callback(key, time)
+
+    def _running(self):
+        controller = self.controller
+        return controller.session == self.session and controller.active and not controller.stopped
@@ -0,0 +1,55 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+
+class CachedPeriods:
+    """The periods the playback loop writes for a sound that is in memory:
+    views of the whole periods of data, the last partial period, copied
+    once and padded with silence when padding is set, and silent_periods
+    periods of silence to fill up the duration.
+
+    Iterating yields tuples of the period and its length in bytes without
+    the padding.
+    """
+
+    def __init__(self, data, period_bytes, silent_periods=0, padding=True):
+        view = memoryview(data)
+        whole_size = len(view) - len(view) % period_bytes
+        tail = view[whole_size:]
+        self.period_bytes = period_bytes
+        self.silent_periods = silent_periods
+        self.silence = bytes(period_bytes)
+        self.data = view[:whole_size]
+        self.tail_length = len(tail)
+        if not tail:
+            self.tail = None
+        elif padding:
+            self.tail = bytes(tail) + self.silence[len(tail):]
+        else:
+            self.tail = bytes(tail)
+
+    def __iter__(self):
+        for start in range(0, len(self.data), self.period_bytes):
+            yield self.data[start:start + self.period_bytes], self.period_bytes
+        if self.tail is not None:
+            yield self.tail, self.tail_length
+        for period in range(self.silent_periods):
+            yield self.silence, self.period_bytes
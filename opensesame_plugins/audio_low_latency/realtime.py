@@ -0,0 +1,99 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import os
+import ctypes
+import ctypes.util
+
+SCHED_OTHER = 'SCHED_OTHER'
+SCHED_FIFO = 'SCHED_FIFO'
+SCHED_RR = 'SCHED_RR'
+POLICIES = [SCHED_OTHER, SCHED_FIFO, SCHED_RR]
+
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+
+def parse_cpus(value):
+    """Returns the set of cores in a semicolon-separated list such as 2;3,
+    an empty value gives an empty set. Raises ValueError."""
+    if isinstance(value, int):
+        return {value}
+    cpus = set()
+    for cpu in str(value).replace(',', ';').split(';'):
+        if cpu.strip() != '':
+            cpus.add(int(cpu))
+    return cpus
+
+
+def set_scheduler(policy, priority):
+    """Sets the scheduling policy of the calling thread. Returns a tuple with
+    the policy and priority that are in effect afterwards and an error
+    message, which is None on success."""
+    error = None
+    if policy != SCHED_OTHER:
+        try:
+            os.sched_setscheduler(0, getattr(os, policy), os.sched_param(priority))
+        except (AttributeError, OSError) as e:
+            error = f'Could not set {policy} with priority {priority}: {e}'
+    return current_scheduler() + (error,)
+
+
+def current_scheduler():
+    try:
+        policy = os.sched_getscheduler(0)
+        priority = os.sched_getparam(0).sched_priority
+    except (AttributeError, OSError):
+        return SCHED_OTHER, 0
+    for name in POLICIES:
+        if getattr(os, name, None) == policy:
+            return name, priority
+    return str(policy), priority
+
+
+def set_affinity(cpus):
+    """Pins the calling thread to cpus. Returns the cores it may run on
+    afterwards and an error message, which is None on success."""
+    error = None
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+        except (AttributeError, OSError, ValueError) as e:
+            error = f'Could not set the CPU affinity to {sorted(cpus)}: {e}'
+    try:
+        return sorted(os.sched_getaffinity(0)), error
+    except AttributeError:
+        return [], error
+
+
+def lock_memory():
+    """Locks all current and future memory of the process in RAM, so the
+    stimulus cache can not be swapped out. Returns an error message, or
+    None on success."""
+    libc_name = ctypes.util.find_library('c')
+    if libc_name is None:
+        return 'Could not lock memory: C library not found'
+    try:
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+            return f'Could not lock memory: {os.strerror(ctypes.get_errno())}'
+    except (AttributeError, OSError) as e:
+        return f'Could not lock memory: {e}'
+    return None
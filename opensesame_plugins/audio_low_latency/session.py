@@ -0,0 +1,132 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import os
+import csv
+import queue
+import threading
+import wave
+
+from libopensesame.oslogging import oslogger
+
+SESSION_BUFFER = 10000
+READ_TIMEOUT = 0.1
+INDEX_FIELDS = ['item', 'label', 'start', 'trigger', 'stop', 'file', 'file_offset']
+
+
+class SessionRecorder(threading.Thread):
+    """Long-lived thread that writes the continuous capture from the ring
+    to one wave file for the whole experiment, or to segment files of
+    segment_frames frames, and keeps a CSV index of the recordings of the
+    record items.
+
+    Index rows hold sample offsets from the first frame of the session, and
+    the file and offset in that file where the recording starts, so the
+    clips can be extracted afterwards. The thread ends when the capture has
+    stopped and all frames in the ring are written. Frames that were
+    overwritten before they were written are replaced by silence and
+    counted in lost_frames.
+    """
+
+    def __init__(self, path, ring, samplewidth, channels, segment_frames=0, read_frames=16384):
+        super().__init__(name='audio_low_latency_session', daemon=True)
+        self.path = path
+        self.ring = ring
+        self.samplewidth = samplewidth
+        self.channels = channels
+        self.segment_frames = segment_frames
+        self.read_frames = read_frames
+        self.index_file = f'{path}_index.csv'
+        self.first_frame = ring.oldest()
+        self.files = []
+        self.lost_frames = 0
+        self.error = None
+        self._marks = queue.Queue()
+        self._wav_file = None
+        self._file_frames = 0
+
+    def mark(self, item, label, start, trigger, stop):
+        """Adds a recording to the index, the frames are ring indices."""
+        self._marks.put((item, label, start, trigger, stop))
+
+    def file_name(self, offset):
+        if not self.segment_frames:
+            return f'{self.path}.wav'
+        return f'{self.path}_{offset // self.segment_frames + 1:03d}.wav'
+
+    def run(self):
+        frame_size = self.samplewidth * self.channels
+        cursor = self.first_frame
+        try:
+            with open(self.index_file, 'w', newline='') as index_file:
+                index = csv.writer(index_file)
+                index.writerow(INDEX_FIELDS)
+                index_file.flush()
+                while True:
+                    start, data = self.ring.read(cursor, self.read_frames, READ_TIMEOUT)
+                    if start is None:
+                        break
+                    if start > cursor:
+                        self.lost_frames += start - cursor
+                        data = bytes((start - cursor) * frame_size) + data
+                    cursor += len(data) // frame_size
+                    self._write(memoryview(data), frame_size)
+                    self._write_marks(index, index_file)
+                self._write_marks(index, index_file)
+        except Exception as e:
+            self.error = e
+            oslogger.error(f'Session recording failed: {e}')
+        finally:
+            if self._wav_file is not None:
+                self._wav_file.close()
+
+    def _write(self, data, frame_size):
+        while data:
+            if self._wav_file is None:
+                self._open_file()
+            frames = len(data) // frame_size
+            if self.segment_frames:
+                frames = min(frames, self.segment_frames - self._file_frames)
+            self._wav_file.writeframes(data[:frames * frame_size])
+            data = data[frames * frame_size:]
+            self._file_frames += frames
+            if self.segment_frames and self._file_frames >= self.segment_frames:
+                self._wav_file.close()
+                self._wav_file = None
+
+    def _open_file(self):
+        filename = self.file_name(len(self.files) * self.segment_frames)
+        self._wav_file = wave.open(filename, 'wb')
+        self._wav_file.setsampwidth(self.samplewidth)
+        self._wav_file.setframerate(self.ring.samplerate)
+        self._wav_file.setnchannels(self.channels)
+        self._file_frames = 0
+        self.files.append(filename)
+
+    def _write_marks(self, index, index_file):
+        if self._marks.empty():
+            return
+        while not self._marks.empty():
+            item, label, start, trigger, stop = self._marks.get()
+            start, trigger, stop = (frame - self.first_frame for frame in (start, trigger, stop))
+            file_offset = start % self.segment_frames if self.segment_frames else start
+            index.writerow([item, label, start, trigger, stop, os.path.basename(self.file_name(start)), file_offset])
+        # the index is usable when the experiment crashes
+        index_file.flush()
@@ -0,0 +1,253 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import os
+import mmap
+import wave
+import struct
+import fnmatch
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+Stimulus = namedtuple('Stimulus', ['sampwidth', 'framerate', 'nchannels', 'nframes', 'data'])
+
+PRELOAD_WORKERS = 4
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# KSDATAFORMAT_SUBTYPE_PCM, the SubFormat GUID of extensible integer PCM
+KSDATAFORMAT_SUBTYPE_PCM = b'\x01\x00\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71'
+
+
+def stimulus_key(path):
+    """Returns the cache key of a file: path, modification time and size."""
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def find_stimuli(pool, pattern):
+    """Returns the files in the file pool whose name matches pattern."""
+    return [path for path in pool.files() if fnmatch.fnmatch(os.path.basename(path), pattern)]
+
+
+def load_stimulus(path):
+    """Reads the header and all frames of a wave file."""
+    with wave.open(path, 'rb') as wav_file:
+        nframes = wav_file.getnframes()
+        return Stimulus(sampwidth=wav_file.getsampwidth(),
+                        framerate=wav_file.getframerate(),
+                        nchannels=wav_file.getnchannels(),
+                        nframes=nframes,
+                        data=wav_file.readframes(nframes))
+
+
+def map_stimulus(path):
+    """Maps a wave file into memory. The data of the returned Stimulus is a
+    read-only memoryview of the data chunk, so frames are only read from
+    disk when they are accessed; close it with close_stimulus. Raises
+    ValueError for unsupported files."""
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _parse_wave(mapped)
+    except Exception:
+        mapped.close()
+        raise
+
+
+def _parse_wave(mapped):
+    if len(mapped) < 12 or mapped[0:4] != b'RIFF' or mapped[8:12] != b'WAVE':
+        raise ValueError('file is not a RIFF/WAVE file')
+
+    fmt = None
+    sub_format = None
+    data_offset = data_size = None
+    position = 12
+    while position + 8 <= len(mapped):
+        chunk_id = mapped[position:position + 4]
+        chunk_size, = struct.unpack_from('<I', mapped, position + 4)
+        position += 8
+        if chunk_id == b'fmt ':
+            fmt = struct.unpack_from('<HHIIHH', mapped, position)
+            if chunk_size >= 40:
+                sub_format = mapped[position + 24:position + 40]
+        elif chunk_id == b'data':
+            data_offset = position
+            # streamed files can have a zero or maximum size data chunk
+            data_size = len(mapped) - position
+            if chunk_size not in (0, 0xFFFFFFFF):
+                data_size = min(chunk_size, data_size)
+            break
+        position += chunk_size + (chunk_size & 1)
+
+    if fmt is None or data_offset is None:
+        raise ValueError('fmt or data chunk missing')
+    format_tag, nchannels, framerate, _byte_rate, block_align, bits = fmt
+    if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE):
+        raise ValueError(f'unsupported wave format {format_tag}')
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and sub_format != KSDATAFORMAT_SUBTYPE_PCM:
+        raise ValueError('unsupported extensible wave format, only integer PCM is supported')
+
+    nframes = data_size // block_align
+    data = memoryview(mapped)[data_offset:data_offset + nframes * block_align]
+    return Stimulus(sampwidth=(bits + 7) // 8,
+                    framerate=framerate,
+                    nchannels=nchannels,
+                    nframes=nframes,
+                    data=data)
+
+
+def close_stimulus(stimulus, views=()):
+    """Closes the memory map of a Stimulus returned by map_stimulus. views
+    are the memoryviews made from its data, they are released first."""
+    for view in views:
+        view.release()
+    mapped = stimulus.data.obj
+    stimulus.data.release()
+    mapped.close()
+
+
+class StimulusCache:
+    """Keeps decoded wave files in memory up to budget bytes, the least
+    recently used files are evicted first."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.preload_total = 0
+        self.preload_count = 0
+        self.preload_errors = 0
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._preload_done = threading.Event()
+        self._preload_done.set()
+        self._futures = []
+
+    def get(self, path):
+        """Returns the Stimulus for path, the file is read on a cache miss.
+        Returns a tuple with the stimulus and True on a cache hit."""
+        return self._get(path, count=True)
+
+    def preload(self, paths, callback=None, max_workers=PRELOAD_WORKERS):
+        """Reads paths into the cache in background threads. callback is
+        called after every file with the number of files done and the total
+        number of files."""
+        self.preload_total = len(paths)
+        self.preload_count = 0
+        self.preload_errors = 0
+        if not paths:
+            return
+        self._preload_done.clear()
+        futures = []
+        self._futures = futures
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='audio_low_latency_preload')
+        for path in paths:
+            future = executor.submit(self._get, path, False)
+            futures.append(future)
+            future.add_done_callback(lambda f: self._preload_finished(f, futures, callback))
+        executor.shutdown(wait=False)
+
+    def wait_preload(self, timeout=None):
+        """Blocks until preloading is done, returns False on a timeout."""
+        return self._preload_done.wait(timeout)
+
+    def cancel_preload(self):
+        """Cancels the files that are not read yet, files that are being
+        read are finished but no longer reported."""
+        futures = self._futures
+        self._futures = []
+        for future in futures:
+            future.cancel()
+        self.preload_total = 0
+        self.preload_count = 0
+        self.preload_errors = 0
+        self._preload_done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _preload_finished(self, future, futures, callback):
+        with self._lock:
+            if futures is not self._futures:
+                # cancelled or replaced by a newer preload
+                return
+            self.preload_count += 1
+            if future.cancelled() or future.exception() is not None:
+                self.preload_errors += 1
+            count = self.preload_count
+        if callback is not None:
+            callback(count, self.preload_total)
+        if count == self.preload_total:
+            self._preload_done.set()
+
+    def _get(self, path, count):
+        key = stimulus_key(path)
+        with self._lock:
+            stimulus = self._entries.get(key)
+            pending = self._pending.get(key)
+            if count and (stimulus is not None or pending is not None):
+                self.hits += 1
+            elif count:
+                self.misses += 1
+            if stimulus is not None:
+                self._entries.move_to_end(key)
+                return stimulus, True
+            # the file is being read by another thread, wait for it instead
+            # of reading it a second time
+            if pending is None:
+                pending = self._pending[key] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            return pending.result(), True
+
+        try:
+            stimulus = load_stimulus(path)
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        else:
+            pending.set_result(stimulus)
+            self._add(key, stimulus)
+        finally:
+            with self._lock:
+                del self._pending[key]
+        return stimulus, False
+
+    def _add(self, key, stimulus):
+        size = len(stimulus.data)
+        if size > self.budget:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            while self.size + size > self.budget:
+                _key, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.data)
+            self._entries[key] = stimulus
+            self.size += size
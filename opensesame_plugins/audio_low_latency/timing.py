@@ -0,0 +1,84 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import time
+
+
+def monotonic():
+    return time.clock_gettime(time.CLOCK_MONOTONIC)
+
+
+def enable_timestamps(pcm):
+    """Enables hardware timestamps on an ALSA PCM. Returns the clock (in
+    seconds) the timestamps refer to, or None when the installed pyalsaaudio
+    does not support timestamps."""
+    import alsaaudio
+
+    if not hasattr(pcm, 'htimestamp'):
+        return None
+    try:
+        pcm.set_tstamp_mode(alsaaudio.PCM_TSTAMP_ENABLE)
+    except (AttributeError, alsaaudio.ALSAAudioError):
+        pass
+    try:
+        pcm.set_tstamp_type(alsaaudio.PCM_TSTAMP_TYPE_MONOTONIC)
+    except (AttributeError, alsaaudio.ALSAAudioError):
+        # ALSA stamps with the wall clock by default
+        return time.time
+    return monotonic
+
+
+def alsa_status(pcm):
+    """Returns the time in seconds of the last hardware pointer update and
+    the number of frames available at that moment, or None when the driver
+    did not provide a timestamp."""
+    try:
+        seconds, nanoseconds, avail = pcm.htimestamp()[:3]
+    except Exception:
+        return None
+    if seconds == 0 and nanoseconds == 0:
+        return None
+    return seconds + nanoseconds / 1e9, avail
+
+
+def portaudio_latency(stream, output):
+    """Returns the latency of a sounddevice or PyAudio stream in seconds."""
+    if hasattr(stream, 'latency'):
+        return stream.latency
+    if output:
+        return stream.get_output_latency()
+    return stream.get_input_latency()
+
+
+def portaudio_read_available(stream):
+    """Returns the number of frames a sounddevice or PyAudio input stream
+    has captured but not yet returned."""
+    if hasattr(stream, 'read_available'):
+        return stream.read_available
+    return stream.get_read_available()
+
+
+def to_clock(clock, source, seconds):
+    """Converts a time in seconds of the source clock to the clock (in ms),
+    using the midpoint of two clock readings around a source reading."""
+    before = clock()
+    now = source()
+    after = clock()
+    return (before + after) / 2 + (seconds - now) * 1000
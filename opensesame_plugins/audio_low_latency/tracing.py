@@ -0,0 +1,93 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import os
+import numpy
+
+from opensesame_plugins.audio_low_latency.devices import PYALSAAUDIO_MODULE_NAME, PYAUDIO_MODULE_NAME, \
+    SOUNDDEVICE_MODULE_NAME
+
+TRACE_NO = 'no'
+TRACE_NPY = 'npy'
+TRACE_CSV = 'csv'
+TRACE_FORMATS = [TRACE_NO, TRACE_NPY, TRACE_CSV]
+FIELDS = ['time', 'available', 'delay']
+GROW_PERIODS = 1024
+
+
+class PeriodTrace:
+    """Per-period trace of a play or record loop, stored in a preallocated
+    array with one row per period: the time the write or read returned (ms),
+    the frames available in the device buffer and the device delay (frames).
+    Values the backend can not report are NaN.
+
+    The array grows by GROW_PERIODS rows when the number of periods was
+    underestimated, e.g. for recordings without a duration.
+    """
+
+    def __init__(self, periods, module, output, buffer_size=None):
+        self.data = numpy.full((max(periods, 1), len(FIELDS)), numpy.nan)
+        self.count = 0
+        self.module = module
+        self.output = output
+        self.buffer_size = buffer_size
+
+    def add(self, stream, time):
+        if self.count == len(self.data):
+            self.data = numpy.concatenate([self.data, numpy.full((GROW_PERIODS, len(FIELDS)), numpy.nan)])
+        row = self.data[self.count]
+        row[0] = time
+        row[1], row[2] = self._device_state(stream)
+        self.count += 1
+
+    def statistics(self):
+        """Returns the mean interval between periods and the standard
+        deviation and maximum absolute deviation from that mean, in ms."""
+        intervals = numpy.diff(self.data[:self.count, 0])
+        if len(intervals) == 0:
+            return numpy.nan, numpy.nan, numpy.nan
+        mean = intervals.mean()
+        return mean, intervals.std(), numpy.abs(intervals - mean).max()
+
+    def save(self, path, fmt):
+        """Writes the trace to path plus the extension of fmt, returns the
+        file name."""
+        filename = f'{path}.{fmt}'
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        if fmt == TRACE_NPY:
+            numpy.save(filename, self.data[:self.count])
+        else:
+            numpy.savetxt(filename, self.data[:self.count], fmt='%.6f', delimiter=',', header=','.join(FIELDS), comments='')
+        return filename
+
+    def _device_state(self, stream):
+        try:
+            if self.module == PYALSAAUDIO_MODULE_NAME:
+                available = stream.avail()
+                delay = self.buffer_size - available if self.output else available
+                return available, delay
+            elif self.module == SOUNDDEVICE_MODULE_NAME:
+                return (stream.write_available if self.output else stream.read_available), numpy.nan
+            elif self.module == PYAUDIO_MODULE_NAME:
+                return (stream.get_write_available() if self.output else stream.get_read_available()), numpy.nan
+        except Exception:
+            # e.g. a stream that is not running or an older pyalsaaudio
+            pass
+        return numpy.nan, numpy.nan
@@ -0,0 +1,79 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import time
+import queue
+import threading
+
+from libopensesame.oslogging import oslogger
+
+
+class AudioWorker(threading.Thread):
+    """Long-lived thread that runs the play or record jobs of the start
+    items, so no thread has to be created right before the onset.
+
+    dispatch_latency is the time in ms between submitting the running job
+    and its first write to the stream, the job calls first_write() right
+    before it. initializer is called in the worker thread
+    before the first job, ready is set when it has returned.
+    """
+
+    def __init__(self, controller, initializer=None, name='audio_low_latency_worker'):
+        super().__init__(name=name, daemon=True)
+        self.controller = controller
+        self.initializer = initializer
+        self.dispatch_latency = None
+        self.ready = threading.Event()
+        self._jobs = queue.Queue()
+        self._dispatch_time = None
+
+    def submit(self, function, *args):
+        self._jobs.put((time.perf_counter(), function, args))
+
+    def first_write(self):
+        if self._dispatch_time is not None:
+            self.dispatch_latency = (time.perf_counter() - self._dispatch_time) * 1000
+            self._dispatch_time = None
+
+    def close(self):
+        self._jobs.put(None)
+
+    def run(self):
+        try:
+            if self.initializer is not None:
+                self.initializer()
+        except Exception as e:
+            oslogger.error(f'Audio worker setup failed: {e}')
+        finally:
+            self.ready.set()
+
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            self._dispatch_time, function, args = job
+            self.dispatch_latency = None
+            try:
+                function(*args)
+            except Exception as e:
+                oslogger.error(f'Audio job failed: {e}')
+                # do not leave the wait and stop items waiting for a session
+                # that will never finish, they raise the error
+                self.controller.fail(e)
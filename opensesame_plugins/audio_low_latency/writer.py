@@ -0,0 +1,116 @@
+"""
+This file is part of OpenSesame.
+
+OpenSesame is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+OpenSesame is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with OpenSesame.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__author__ = "Bob Rosbag"
+__license__ = "GPLv3"
+
+import time
+import queue
+import threading
+
+QUEUE_PERIODS = 4096
+BATCH_PERIODS = 16
+
+
+class WriterResult:
+    """Statistics of one recording, filled in by the writer thread while
+    it writes and complete when done is set."""
+
+    def __init__(self):
+        self.high_water = 0
+        self.write_times = []
+        self.error = None
+        self.done = threading.Event()
+
+
+class DiskWriter(threading.Thread):
+    """Long-lived thread that writes captured periods to the wave file of
+    a recording, so a stalling file system does not delay the next read of
+    the capture thread.
+
+    Periods are passed through a queue of at most QUEUE_PERIODS periods and
+    written in batches of BATCH_PERIODS. A recording starts with begin() and
+    ends with end(), both are queued, so the next recording can start while
+    the writer is still busy with the previous one. begin() and end()
+    return the WriterResult of the recording with the largest number of
+    periods that waited in the queue, the duration of every write in ms
+    and a write error, if any; the remaining periods of a recording are
+    dropped after an error.
+    """
+
+    def __init__(self, max_periods=QUEUE_PERIODS, batch_periods=BATCH_PERIODS):
+        super().__init__(name='audio_low_latency_writer', daemon=True)
+        self.batch_periods = batch_periods
+        self._result = None
+        self._wav_file = None
+        self._current = None
+        self._queue = queue.Queue(max_periods)
+
+    def begin(self, wav_file):
+        self._result = WriterResult()
+        self._queue.put((wav_file, self._result))
+        return self._result
+
+    def put(self, data):
+        # blocks when the queue is full, the capture thread then overruns
+        # instead of memory growing without bound
+        self._queue.put(data)
+        size = self._queue.qsize()
+        if size > self._result.high_water:
+            self._result.high_water = size
+
+    def end(self):
+        result = self._result
+        self._queue.put(result)
+        return result
+
+    def finish(self):
+        """Ends the recording and waits until all its periods are written."""
+        result = self.end()
+        result.done.wait()
+        return result
+
+    def close(self):
+        self._queue.put(None)
+
+    def run(self):
+        batch = []
+        while True:
+            data = self._queue.get()
+            if data is None:
+                break
+            if type(data) is tuple:
+                self._wav_file, self._current = data
+            elif type(data) is WriterResult:
+                self._write(batch)
+                batch = []
+                data.done.set()
+            else:
+                batch.append(data)
+                if len(batch) >= self.batch_periods:
+                    self._write(batch)
+                    batch = []
+
+    def _write(self, batch):
+        if not batch or self._current.error is not None:
+            return
+        start_time = time.perf_counter()
+        try:
+            self._wav_file.writeframes(b''.join(batch))
+        except Exception as e:
+            self._current.error = e
+        self._current.write_times.append((time.perf_counter() - start_time) * 1000)
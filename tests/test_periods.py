@@ -0,0 +1,36 @@
+from opensesame_plugins.audio_low_latency.periods import CachedPeriods
+
+PERIOD_BYTES = 1024 * 4
+
+
+def _periods(data, silent_periods=0, padding=True):
+    return [(bytes(period), length) for period, length in CachedPeriods(data, PERIOD_BYTES, silent_periods, padding)]
+
+
+def test_shorter_than_one_period_plays_the_tail():
+    # duration=10 ms at 44.1 kHz: 441 frames, no whole period
+    data = bytes(range(1, 256)) * 7
+    data = data[:441 * 4]
+    periods = _periods(data)
+    assert len(periods) == 1
+    period, length = periods[0]
+    assert length == 441 * 4
+    assert period[:length] == data
+    assert period[length:] == bytes(PERIOD_BYTES - length)
+
+
+def test_shorter_than_one_period_without_padding():
+    data = b'\x01' * (441 * 4)
+    assert _periods(data, padding=False) == [(data, 441 * 4)]
+
+
+def test_whole_periods_tail_and_silence():
+    data = b'\x01' * (2 * PERIOD_BYTES + 8)
+    periods = _periods(data, silent_periods=2)
+    assert [length for period, length in periods] == [PERIOD_BYTES, PERIOD_BYTES, 8, PERIOD_BYTES, PERIOD_BYTES]
+    assert all(len(period) == PERIOD_BYTES for period, length in periods)
+    assert periods[-1][0] == bytes(PERIOD_BYTES)
+
+
+def test_empty_sound_plays_only_silence():
+    assert _periods(b'', silent_periods=1) == [(bytes(PERIOD_BYTES), PERIOD_BYTES)]